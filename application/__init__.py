@@ -1,9 +1,9 @@
 """Initialize application."""
 from werkzeug.exceptions import default_exceptions, HTTPException, InternalServerError
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dictalchemy import make_class_dictable
 
 from flask import Flask, request, session, render_template
-from flask_session import Session
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect, CSRFError
@@ -17,23 +17,50 @@ from .internal.filters import usd, capitalize
 from .internal.emails import Emails
 from .internal.stocks import Stocks
 from .internal.otps import OTPs
+from .internal.passwords import Passwords
+from .internal.ratelimits import RateLimiter
+from .internal.cachepolicy import CachePolicy
+from .internal.compression import Compression
+from .internal.serializers import JSONSerializer
 from .internal.tokens import URLTokens
 from .internal.sms import SMSs
 from .internal.geolocations import GeoLocations
+from .internal.queries import LoadingPolicyQuery
+from .internal.instrumentation import SQLInstrumentation
+from .internal.metrics import metrics
+from .internal.profiler import Profiler
+from .internal.memory import MemoryDiagnostics
+from .internal.tracing import Tracer
+from .internal.cassettes import cassettes
+from .internal.credits import governor
+from .internal.breakers import breakers
+from .internal.sessions import DatabaseSessions
 from .views.templates import BaseTemplates as _templates
 
-db = SQLAlchemy()
+db = SQLAlchemy(query_class=LoadingPolicyQuery)
 csrf = CSRFProtect()
 mail = Emails()
 stock = Stocks()
 otp = OTPs()
+passwords = Passwords()
+limiter = RateLimiter()
+cache_policy = CachePolicy()
+compression = Compression()
+serializer = JSONSerializer()
 token = URLTokens()
 sms = SMSs()
 geo = GeoLocations()
+sql = SQLInstrumentation()
+profiler = Profiler()
+memory = MemoryDiagnostics()
+tracer = Tracer()
+sessions = DatabaseSessions()
 
 def create_app():	
 	app = Flask(__name__)
 	app.config.from_pyfile('config.py')
+	if app.config["PROXY_COUNT"]:
+		app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_COUNT"], x_proto=app.config["PROXY_COUNT"])
 
 	app.jinja_env.filters["usd"] = usd
 	app.jinja_env.filters["capitalize"] = capitalize
@@ -47,7 +74,8 @@ def create_app():
 		from . import models
 	
 	Migrate(app, db)
-	Session(app)
+	sessions.init(app)
+	limiter.init(app)
 	Bootstrap(app)
 	FontAwesome(app)
 	Mobility(app)
@@ -65,22 +93,30 @@ def create_app():
 	for code in default_exceptions:
 		app.errorhandler(code)(errorhandler)
 
+	with app.app_context():
+		from .manager import UserContext
+
+	# Registered first so the responses are compressed after the other hooks ran
+	compression.init(app)
+	profiler.init(app, UserContext.is_admin)
+	tracer.init(app)
+	metrics.init(app)
+	sql.init(app)
+	cassettes.init(app)
+	governor.init(app)
+	breakers.init(app)
+	passwords.init(app)
+	serializer.init(app)
 	mail.init(app)
 	stock.init(app)
 	token.init(app)
 	sms.init(app)
 	geo.init(app)
+	memory.init(app)
+	cache_policy.init(app)
 
 	with app.app_context():
 		from .views import auths, accounts, portfolios
-		from .apis import markets, portfolios, tokens
-
-	@app.after_request
-	def after_request(response):
-		"""Ensure responses aren't cached"""
-		response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-		response.headers["Expires"] = 0
-		response.headers["Pragma"] = "no-cache"
-		return response
+		from .apis import markets, portfolios, tokens, diagnostics, metrics as _metrics
 
 	return app
@@ -0,0 +1,39 @@
+"""Application diagnostics routes."""
+from functools import wraps
+
+from flask import current_app as app, request
+
+from ..manager import UserContext
+from .. import csrf, memory, serializer
+
+def admin_required(jwt_only=False):
+	"""
+	Decorate routes to require the admin (session or JWT). Routes with side effects are
+	jwt_only as the bearer token, unlike the session cookie, isn't sent cross-site
+	"""
+	def decorator(f):
+		@wraps(f)
+		def decorated_function(*args, **kwargs):
+			if not UserContext.is_admin(jwt_only):
+				return serializer.jsonify({"msg": "Forbidden"}), 403
+			return f(*args, **kwargs)
+		return decorated_function
+	return decorator
+
+@app.route("/admin/memory", methods=["POST"])
+@admin_required(jwt_only=True)
+@csrf.exempt
+def memory_snapshot():
+	"""Takes a memory snapshot returning the report (top allocation sites, the difference 
+	from the previous snapshot and the cache sizes). stop=true stops tracing allocations"""
+	if request.args.get("stop", default="false").lower() == "true":
+		memory.stop()
+		return serializer.jsonify({"msg": "Tracing stopped"}), 200
+	return serializer.jsonify(memory.snapshot()), 200
+
+@app.route("/admin/caches", methods=["GET"])
+@admin_required()
+@csrf.exempt
+def cache_sizes():
+	"""The entries and approximate size of each cache (doesn't trace allocations)"""
+	return serializer.jsonify(memory.cache_sizes()), 200
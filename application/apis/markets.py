@@ -1,23 +1,66 @@
 """Application Rest routes."""
-from flask import current_app as app, request, session, jsonify
+from flask import current_app as app, request, session, stream_with_context
 from flask_jwt_extended import jwt_required
 
+from ..internal.stocks import Stocks
 from ..manager import PortfolioManager
-from .. import csrf
+from .. import csrf, limiter, cache_policy, serializer
+
+# The maximum number of symbols priced per request
+PRICES_LIMIT = 500
 
 @app.route("/market/suggested-symbols", methods=["GET"])
 @jwt_required
+@limiter.limit("market")
+@cache_policy.conditional(PortfolioManager.suggested_stocks)
 @csrf.exempt
 def suggested_symbols():
 	"""Returns the suggested symbols"""
-	return jsonify(PortfolioManager.suggested_stocks()), 200
+	return serializer.jsonify(PortfolioManager.suggested_stocks()), 200
 
 @app.route("/market/price", methods=["GET"])
 @jwt_required
+@limiter.limit("market")
 @csrf.exempt
 def price():
 	"""Looks up the price of the stock"""
 	price = PortfolioManager.asking_price(request.args.get("symbol", default = ""))
 	if price is None:
-		return jsonify({"msg": "Invalid Symbol"}), 400
-	return jsonify(price), 200
+		return serializer.jsonify({"msg": "Invalid Symbol"}), 400
+	return serializer.jsonify(price), 200
+
+def __prices(chunks):
+	"""Writes the quotes as they're looked up followed by the symbols which couldn't be priced"""
+	errors = {}
+	separator = ""
+	yield '{"prices":{'
+	for symbols, quotes in chunks:
+		for symbol in symbols:
+			if not symbol in quotes:
+				errors[symbol] = "Price unavailable"
+			elif quotes[symbol] is None:
+				errors[symbol] = "Invalid Symbol"
+			else:
+				yield f'{separator}{serializer.dumps(symbol)}:{serializer.dumps(quotes[symbol])}'
+				separator = ","
+	yield f'}},"errors":{serializer.dumps(errors)}}}'
+
+@app.route("/market/prices", methods=["GET"])
+@jwt_required
+@limiter.limit("market")
+@csrf.exempt
+def prices():
+	"""Looks up the prices (quotes) of the comma separated stocks, more than a batch are streamed"""
+	symbols = [symbol.strip().upper() for symbol in request.args.get("symbols", default = "").split(",")]
+	symbols = list(dict.fromkeys(filter(None, symbols)))
+	if not symbols:
+		return serializer.jsonify({"msg": "Missing symbols parameter"}), 400
+	if len(symbols) > PRICES_LIMIT:
+		return serializer.jsonify({"msg": f"At most {PRICES_LIMIT} symbols"}), 400
+
+	body = __prices(PortfolioManager.asking_prices(symbols))
+	if len(symbols) > Stocks.BATCH_LIMIT:
+		body = stream_with_context(body)
+	else:
+		body = "".join(body)
+	return app.response_class(body, mimetype="application/json"), 200
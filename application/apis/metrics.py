@@ -0,0 +1,18 @@
+"""Application metrics routes."""
+from hmac import compare_digest
+
+from flask import current_app as app, request
+
+from ..internal.metrics import metrics
+from .. import csrf, serializer
+
+@app.route("/metrics", methods=["GET"])
+@csrf.exempt
+def metrics_text():
+	"""The application metrics in the prometheus text format. Requires the metrics token
+	as a bearer token, the endpoint is disabled when one isn't configured"""
+	if not metrics.token:
+		return serializer.jsonify({"msg": "Not Found"}), 404
+	if not compare_digest(request.headers.get("Authorization", ""), f"Bearer {metrics.token}"):
+		return serializer.jsonify({"msg": "Unauthorized"}), 401
+	return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
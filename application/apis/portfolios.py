@@ -1,30 +1,109 @@
 """Application Rest routes."""
-from flask import current_app as app, request, session, jsonify
+import base64
+
+from flask import current_app as app, request, session
 from flask_jwt_extended import jwt_required
 
 from ..manager import PortfolioManager, Registrar
-from .. import csrf
+from .. import csrf, limiter, cache_policy, serializer
 
 @app.route("/portfolio/holdings", methods=["GET"])
 @jwt_required
+@limiter.limit("portfolio")
+@cache_policy.conditional(PortfolioManager.holdings_version)
 @csrf.exempt
 def holdings():
 	"""Looks up the user's holdings"""
-	return jsonify(PortfolioManager.holdings()), 200
+	return serializer.jsonify(PortfolioManager.holdings()), 200
 
 @app.route("/portfolio/holding", methods=["GET"])
 @jwt_required
+@limiter.limit("portfolio")
 @csrf.exempt
 def holding():
 	"""Looks up the holding"""
 	holding = PortfolioManager.holding(request.args.get("id", default = 0))
 	if holding is None:
-		return jsonify({"msg": "Invalid Holding"}), 400
-	return jsonify(holding), 200
+		return serializer.jsonify({"msg": "Invalid Holding"}), 400
+	return serializer.jsonify(holding), 200
 
 @app.route("/portfolio/holding-symbols", methods=["GET"])
 @jwt_required
+@limiter.limit("portfolio")
+@cache_policy.conditional(PortfolioManager.holdings_version)
 @csrf.exempt
 def holding_symbols():
 	"""Looks up the symbols for the user's holdings"""
-	return jsonify(PortfolioManager.holding_symbols()), 200
+	return serializer.jsonify(PortfolioManager.holding_symbols()), 200
+
+# The closed positions returned per page by default / at most
+CLOSED_POSITIONS_PAGE = 50
+CLOSED_POSITIONS_LIMIT = 200
+
+def __fields(available):
+	"""The comma separated fields requested (all of them when not specified) in the order 
+	they're available, raises ValueError for unknown fields"""
+	fields = request.args.get("fields")
+	if fields is None:
+		return available
+
+	requested = set(filter(None, (field.strip() for field in fields.split(","))))
+	unknown = requested.difference(available)
+	if unknown:
+		raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+	if not requested:
+		raise ValueError("Missing fields")
+	return tuple(field for field in available if field in requested)
+
+@app.route("/portfolio/summary", methods=["GET"])
+@jwt_required
+@limiter.limit("portfolio")
+@csrf.exempt
+def portfolio_summary():
+	"""The user's portfolio summary, the quotes are looked up in batches and only when the
+	selected fields (fields=symbol,shares,value,...) of the positions need them"""
+	try:
+		fields = __fields(PortfolioManager.POSITION_FIELDS)
+	except ValueError as e:
+		return serializer.jsonify({"msg": str(e)}), 400
+	return serializer.jsonify(PortfolioManager.summary(fields)), 200
+
+@app.route("/portfolio/position", methods=["GET"])
+@jwt_required
+@limiter.limit("portfolio")
+@csrf.exempt
+def portfolio_position():
+	"""The user's position in the stock limited to the selected fields"""
+	try:
+		fields = __fields(PortfolioManager.POSITION_FIELDS)
+	except ValueError as e:
+		return serializer.jsonify({"msg": str(e)}), 400
+
+	positions = PortfolioManager.positions(fields, request.args.get("symbol", default = ""))
+	if not positions:
+		return serializer.jsonify({"msg": "Invalid Position"}), 400
+	return serializer.jsonify(positions[0]), 200
+
+@app.route("/portfolio/closed-positions", methods=["GET"])
+@jwt_required
+@limiter.limit("portfolio")
+@cache_policy.conditional(PortfolioManager.holdings_version)
+@csrf.exempt
+def portfolio_closed_positions():
+	"""A page (limit=) of the user's closed positions (latest first) limited to the selected 
+	fields. The next page continues from the returned cursor (cursor=), null on the last page"""
+	try:
+		fields = __fields(PortfolioManager.CLOSED_POSITION_FIELDS)
+	except ValueError as e:
+		return serializer.jsonify({"msg": str(e)}), 400
+
+	limit = min(max(request.args.get("limit", default = CLOSED_POSITIONS_PAGE, type = int), 1), CLOSED_POSITIONS_LIMIT)
+	cursor = request.args.get("cursor")
+	try:
+		after = None if cursor is None else int(base64.urlsafe_b64decode(cursor.encode()).decode())
+	except ValueError:
+		return serializer.jsonify({"msg": "Invalid cursor"}), 400
+
+	positions, after = PortfolioManager.closed_positions_page(fields, limit, after)
+	cursor = None if after is None else base64.urlsafe_b64encode(str(after).encode()).decode()
+	return serializer.jsonify({"positions": positions, "cursor": cursor}), 200
@@ -1,11 +1,11 @@
 import datetime
 
-from flask import current_app as app, jsonify, request
+from flask import current_app as app, request
 from flask_jwt_extended import jwt_refresh_token_required
 
 from ..internal.tokens import JWTTokens
 from ..manager import BasicAuth
-from .. import csrf
+from .. import csrf, limiter, serializer, cache_policy
 
 def __access_token(user_id: int = None):
     expires = datetime.timedelta(minutes=app.config["API_ACCESS_EXPIRES"])
@@ -16,36 +16,42 @@ def __refresh_token(user_id: int):
     return JWTTokens.refresh(user_id, expires)
 
 @app.route("/token", methods=["GET", "POST"])
+@limiter.limit("token")
+@cache_policy.sensitive
 @csrf.exempt
 def token():
     if not request.is_json:
-        return jsonify({"msg": "Missing JSON in request"}), 400
+        return serializer.jsonify({"msg": "Missing JSON in request"}), 400
 
     username = request.json.get('username', None)
     password = request.json.get('password', None)
     if not username:
-        return jsonify({"msg": "Missing username parameter"}), 400
+        return serializer.jsonify({"msg": "Missing username parameter"}), 400
     if not password:
-        return jsonify({"msg": "Missing password parameter"}), 400
+        return serializer.jsonify({"msg": "Missing password parameter"}), 400
 
     try:
         user = BasicAuth.authenticate(username, password)
     except (BasicAuth.BadCredentials, BasicAuth.AccountLocked):
-        return jsonify({"msg": "Bad username or password"}), 400
+        return serializer.jsonify({"msg": "Bad username or password"}), 400
+    except BasicAuth.Busy:
+        return serializer.jsonify({"msg": "Too many logins, retry shortly"}), 503, {"Retry-After": "1"}
 
     if not user.verified:
-        return jsonify({"msg": "Account must be verified before accessing APIs"}), 400
+        return serializer.jsonify({"msg": "Account must be verified before accessing APIs"}), 400
     tokens = {
         'access_token': __access_token(user.id),
         'refresh_token': __refresh_token(user.id)
     }
-    return jsonify(tokens), 200
+    return serializer.jsonify(tokens), 200
 
 @app.route('/token/refresh', methods=['POST'])
 @jwt_refresh_token_required
+@limiter.limit("refresh")
+@cache_policy.sensitive
 @csrf.exempt
 def refresh():
     token = {
         'access_token': __access_token()
     }
-    return jsonify(token), 200
+    return serializer.jsonify(token), 200
@@ -0,0 +1,223 @@
+""" Manager layer micro-benchmarks """
+import gzip
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, session, jsonify
+
+from .internal import caches
+from .internal.iexstub import IEXStub
+from .internal.compression import brotli
+from .internal.serializers import Columns
+from .manager import PortfolioManager, AccountManager
+from .models import Balances, Holdings, ClosedPositions, Transacted
+from .seeds import Seeder
+from .views.templates import PortfolioTemplates
+from . import db, stock, sql, serializer
+
+class Benchmarks:
+    """ Times the manager layer (and template rendering) against the seeded users with
+        the IEX calls served by a local stub. Results are written as json so they can be
+        compared across commits """
+
+    class NoUsers(Exception):
+        """ Indicates there aren't any seeded users to benchmark against """
+        pass
+
+    def __init__(self, users=25, repeat=5, cold=False):
+        self.user_ids = Seeder.user_ids(users)
+        if not self.user_ids:
+            raise self.NoUsers("Seed users first (manage.py seed)")
+        self.repeat = repeat
+        self.cold = cold
+
+    @staticmethod
+    def __commit():
+        try:
+            return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @staticmethod
+    def __summary(times, queries):
+        times = sorted(times)
+        return {
+            "calls": len(times),
+            "mean_ms": statistics.mean(times) * 1000,
+            "median_ms": statistics.median(times) * 1000,
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+            "min_ms": times[0] * 1000,
+            "max_ms": times[-1] * 1000,
+            "ops_per_sec": len(times) / sum(times) if sum(times) > 0 else None,
+            "queries": statistics.mean(queries) if queries else None
+        }
+
+    def __time(self, fn, user_ids):
+        """ Times the function for each user, returning the per call times and query counts """
+        times = []
+        queries = []
+        for _ in range(self.repeat):
+            for user_id in user_ids:
+                with current_app.test_request_context():
+                    if not user_id is None:
+                        session["user_id"] = user_id
+                    if self.cold:
+                        for cache in caches.registry.values():
+                            cache.clear()
+
+                    with sql.capture() as stats:
+                        start = time.perf_counter()
+                        fn()
+                        times.append(time.perf_counter() - start)
+                    if sql.enabled:
+                        queries.append(stats.count)
+        return times, queries
+
+    @staticmethod
+    def __update_balances():
+        """ Updates the balances removing them afterwards so runs don't accumulate rows """
+        last_id = db.session.query(db.func.max(Balances.id)).scalar() or 0
+        AccountManager.update_balances()
+        Balances.query.filter(Balances.id > last_id).delete()
+        db.session.commit()
+
+    def benchmarks(self):
+        portfolio = lambda: PortfolioTemplates.portfolio(PortfolioManager.portfolio())
+        return {
+            "portfolio": (PortfolioManager.portfolio, self.user_ids),
+            "closed_positions": (PortfolioManager.closed_positions, self.user_ids),
+            "history": (lambda: PortfolioManager.history(1).items, self.user_ids),
+            "insights": (PortfolioManager.insights, self.user_ids),
+            "render_portfolio": (portfolio, self.user_ids),
+            "render_history": (lambda: PortfolioTemplates.history(PortfolioManager.history(1)), self.user_ids),
+            "update_balances": (self.__update_balances, [None])
+        }
+
+    @contextmanager
+    def __stub(self):
+        """ Serves the IEX calls from a local stub """
+        stub = IEXStub().start()
+        base_url = stock.base_url
+        stock.base_url = stub.url
+        try:
+            yield
+        finally:
+            stock.base_url = base_url
+            stub.stop()
+
+    def __envelope(self, results):
+        return {
+            "commit": self.__commit(),
+            "time": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "database": db.engine.name,
+            "users": len(self.user_ids),
+            "repeat": self.repeat,
+            "cold": self.cold,
+            "results": results
+        }
+
+    def run(self, only=None):
+        """ Runs the benchmarks (optionally only the named ones) against the local IEX stub """
+        results = {}
+        with self.__stub():
+            for name, (fn, user_ids) in self.benchmarks().items():
+                if only and not name in only:
+                    continue
+                self.__time(fn, user_ids[:1])
+                results[name] = self.__summary(*self.__time(fn, user_ids))
+        return self.__envelope(results)
+
+    @staticmethod
+    def payloads():
+        """ The typical compressed response bodies, the JSON APIs (the html pages aren't compressed) """
+        return {
+            "holdings": lambda: serializer.dumps(PortfolioManager.holdings()),
+            "summary": lambda: serializer.dumps(PortfolioManager.summary(PortfolioManager.POSITION_FIELDS)),
+            "closed_positions": lambda: serializer.dumps(PortfolioManager.closed_positions_page(PortfolioManager.CLOSED_POSITION_FIELDS, 200)[0]),
+            "prices": lambda: serializer.dumps(stock.quotes(PortfolioManager.suggestions))
+        }
+
+    @staticmethod
+    def codecs():
+        """ The gzip levels and (when installed) brotli qualities compared """
+        codecs = {f"gzip-{level}": (lambda data, level=level: gzip.compress(data, level)) for level in (1, 6, 9)}
+        if not brotli is None:
+            codecs.update({f"br-{quality}": (lambda data, quality=quality: brotli.compress(data, quality=quality)) for quality in (1, 4, 11)})
+        return codecs
+
+    def compression(self):
+        """ Compresses the users' payloads with each codec, reporting the cpu time spent
+            against the bytes saved """
+        bodies = {name: [] for name in self.payloads()}
+        with self.__stub():
+            for user_id in self.user_ids:
+                with current_app.test_request_context():
+                    session["user_id"] = user_id
+                    for name, render in self.payloads().items():
+                        bodies[name].append(render().encode())
+
+        results = {}
+        for name, datas in bodies.items():
+            size = sum(len(data) for data in datas)
+            result = results[name] = {"bytes": size / len(datas), "codecs": {}}
+            for codec, compress in self.codecs().items():
+                start = time.process_time()
+                for _ in range(self.repeat):
+                    compressed = sum(len(compress(data)) for data in datas)
+                cpu = (time.process_time() - start) / self.repeat
+                result["codecs"][codec] = {
+                    "bytes": compressed / len(datas),
+                    "ratio": size / compressed if compressed else None,
+                    "saved_pct": (1 - compressed / size) * 100 if size else None,
+                    "cpu_ms": cpu / len(datas) * 1000,
+                    "mb_per_sec": size / cpu / 1e6 if cpu > 0 else None,
+                    "saved_kb_per_cpu_ms": (size - compressed) / 1024 / (cpu * 1000) if cpu > 0 else None
+                }
+        return self.__envelope(results)
+
+    @staticmethod
+    def serializers(model):
+        """ The ways of serializing the model's rows compared, dictalchemy + jsonify (the
+            baseline), the precompiled columns of the instances and of the selected rows """
+        columns = Columns(model)
+        return {
+            "asdict_jsonify": lambda query: jsonify([row.asdict() for row in query]).get_data(),
+            "columns": lambda query: serializer.jsonify([columns(row) for row in query]).get_data(),
+            "columns_rows": lambda query: serializer.jsonify(columns.rows(query)).get_data()
+        }
+
+    def serialization(self):
+        """ Serializes the users' holdings, closed positions and transactions (query included)
+            with each serializer, reporting the rows per second """
+        results = {}
+        for model in (Holdings, ClosedPositions, Transacted):
+            query = model.query.filter(model.user_id.in_(self.user_ids)).order_by(model.id)
+            rows = query.count()
+            result = results[model.__tablename__] = {"rows": rows, "backend": serializer.backend, "serializers": {}}
+            for name, serialize in self.serializers(model).items():
+                times = []
+                with current_app.test_request_context():
+                    serialize(query)
+                    for _ in range(self.repeat):
+                        start = time.perf_counter()
+                        size = len(serialize(query))
+                        times.append(time.perf_counter() - start)
+                        db.session.expunge_all()
+                result["serializers"][name] = {
+                    "bytes": size,
+                    "median_ms": statistics.median(times) * 1000,
+                    "rows_per_sec": rows / statistics.median(times) if rows else None
+                }
+        return self.__envelope(results)
+
+    @staticmethod
+    def write(results, path):
+        with open(path, "w") as out:
+            json.dump(results, out, indent=1)
@@ -1,6 +1,6 @@
 """Application Configuration."""
-from os import environ
-from tempfile import mkdtemp
+from os import environ, path
+from tempfile import gettempdir
 
 def __is_present(name):
 	return not environ.get(name) is None
@@ -17,9 +17,41 @@ def __optional_variable(name, default):
 
 # IEX API
 IEX_API_KEY = __required_variable("IEX_API_KEY")
+IEX_BASE_URL = __optional_variable("IEX_BASE_URL", "https://cloud-sse.iexapis.com/stable")
+# Daily message credit budget (0 only counts the credits). Once the projected burn reaches the conserve
+# fraction the cache ttls are stretched and quotes fetched in batches, at the shed fraction news and
+# market lists are no longer fetched
+IEX_DAILY_CREDITS = int(__optional_variable("IEX_DAILY_CREDITS", 0))
+IEX_CONSERVE_AT = float(__optional_variable("IEX_CONSERVE_AT", 0.8))
+IEX_SHED_AT = float(__optional_variable("IEX_SHED_AT", 0.95))
+IEX_TTL_STRETCH = float(__optional_variable("IEX_TTL_STRETCH", 4))
+
+# Upstream APIs (IEX, ipinfo, Twilio, SMTP) mode: live, record (responses are written to the
+# cassette dir) or replay (recorded responses are served after the latency, e.g. iex=80,*=20)
+UPSTREAM_MODE = __optional_variable("UPSTREAM_MODE", "live")
+CASSETTE_DIR = __optional_variable("CASSETTE_DIR", path.join(gettempdir(), "fin4dummy-cassettes"))
+REPLAY_LATENCY_MS = __optional_variable("REPLAY_LATENCY_MS", "")
+
+# Circuit breakers of the upstream services: a circuit opens once the error rate (failed or slower than
+# the slow ms) of its last window calls reaches the rate, it fails fast for the open seconds then lets a
+# probe call through. Quotes, news and market lists fall back to their last known good results
+UPSTREAM_TIMEOUT = float(__optional_variable("UPSTREAM_TIMEOUT", 5))
+UPSTREAM_FALLBACK_SIZE = int(__optional_variable("UPSTREAM_FALLBACK_SIZE", 1024))
+BREAKER_WINDOW = int(__optional_variable("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(__optional_variable("BREAKER_MIN_CALLS", 10))
+BREAKER_ERROR_RATE = float(__optional_variable("BREAKER_ERROR_RATE", 0.5))
+BREAKER_SLOW_MS = int(__optional_variable("BREAKER_SLOW_MS", 2000))
+BREAKER_OPEN_SECONDS = int(__optional_variable("BREAKER_OPEN_SECONDS", 30))
 
 # IPINFO API
 IPINFO_TOKEN = __required_variable("IPINFO_TOKEN")
+# Locations are looked up off the request by the workers and cached per address (ttl in seconds)
+GEO_WORKERS = int(__optional_variable("GEO_WORKERS", 2))
+GEO_CACHE_SIZE = int(__optional_variable("GEO_CACHE_SIZE", 4096))
+GEO_CACHE_TTL = int(__optional_variable("GEO_CACHE_TTL", 86400))
+# Compiled offline range database (manage.py geo_database) checked for changes every interval (seconds)
+GEO_DATABASE = __optional_variable("GEO_DATABASE", "")
+GEO_RELOAD_INTERVAL = int(__optional_variable("GEO_RELOAD_INTERVAL", 30))
 
 # Tokens
 TOKEN_AGE = int(__required_variable("TOKEN_AGE"))
@@ -30,6 +62,20 @@ SMPT_PORT = __required_variable("SMPT_PORT")
 SMPT_SENDER = __required_variable("SMPT_SENDER")
 SMPT_SENDER_FROM = __required_variable("SMPT_SENDER_FROM")
 SMPT_SENDER_PWD = __required_variable("SMPT_SENDER_PWD")
+SMPT_SSL = __optional_variable("SMPT_SSL", "True").lower() == "true"
+# Connections are pooled, idle connections are checked (NOOP) before they're reused
+SMPT_POOL_SIZE = int(__optional_variable("SMPT_POOL_SIZE", 2))
+SMPT_MAX_IDLE = int(__optional_variable("SMPT_MAX_IDLE", 30))
+# Mails / SMS are added to the outbox and delivered by the drain_outbox worker (dead lettered
+# after the max attempts). Disabled they're sent from the app
+OUTBOX_ENABLED = __optional_variable("OUTBOX_ENABLED", "True").lower() == "true"
+OUTBOX_MAX_ATTEMPTS = int(__optional_variable("OUTBOX_MAX_ATTEMPTS", 6))
+# Days sent / dead notifications are kept before the worker purges them (0 keeps them)
+OUTBOX_RETENTION_DAYS = int(__optional_variable("OUTBOX_RETENTION_DAYS", 7))
+# Mails are sent in the background by the workers (0 sends them on the request) in batches
+MAIL_WORKERS = int(__optional_variable("MAIL_WORKERS", 2))
+MAIL_BATCH_SIZE = int(__optional_variable("MAIL_BATCH_SIZE", 20))
+MAIL_QUEUE_SIZE = int(__optional_variable("MAIL_QUEUE_SIZE", 1000))
 
 # SMS / Twilio
 TWILIO_SID = __required_variable("TWILIO_SID")
@@ -54,17 +100,80 @@ SQLALCHEMY_DATABASE_URI = __required_variable('SQLALCHEMY_DATABASE_URI')
 if __is_present("SQLALCHEMY_ECHO"):
 	SQLALCHEMY_ECHO = environ.get('SQLALCHEMY_ECHO').lower()  == 'true'
 
+# Fail any relationship access that wasn't explicitly loaded (testing)
+SQLALCHEMY_STRICT_LOADING = __optional_variable('SQLALCHEMY_STRICT_LOADING', 'false').lower() == 'true'
+
 if __is_present("SQLALCHEMY_POOL_RECYCLE"):
 	SQLALCHEMY_POOL_RECYCLE = int(environ.get('SQLALCHEMY_POOL_RECYCLE'))
 
 if __is_present("SQLALCHEMY_POOL_TIMEOUT"):
 	SQLALCHEMY_POOL_TIMEOUT = int(environ.get('SQLALCHEMY_POOL_TIMEOUT'))
 
+# SQL instrumentation (per request query counts / timings and N+1 detection)
+SQL_INSTRUMENTATION = __optional_variable('SQL_INSTRUMENTATION', 'true').lower() == 'true'
+SQL_SLOWEST_STATEMENTS = int(__optional_variable('SQL_SLOWEST_STATEMENTS', 3))
+SQL_REPEATED_STATEMENTS = int(__optional_variable('SQL_REPEATED_STATEMENTS', 3))
+# Level of the per request query counts (INFO) and slowest statements (DEBUG), requests spending
+# longer than the slow threshold (ms, 0 disables) in the DB are logged as warnings
+SQL_LOG_LEVEL = __optional_variable('SQL_LOG_LEVEL', 'INFO')
+SQL_SLOW_REQUEST_MS = int(__optional_variable('SQL_SLOW_REQUEST_MS', 500))
+
+# Metrics (bearer token required to scrape /metrics, disabled when not set)
+METRICS_TOKEN = __optional_variable('METRICS_TOKEN', None)
+
+# Request profiler (admins profile a request with the X-Profile: 1 header or __profile=1 arg,
+# optionally a sample of requests is profiled keeping the N slowest per hour)
+PROFILER_ENABLED = __optional_variable('PROFILER_ENABLED', 'false').lower() == 'true'
+PROFILER_DIR = __optional_variable('PROFILER_DIR', path.join(gettempdir(), 'fin4dummy-profiles'))
+PROFILER_SLOWEST_PER_HOUR = int(__optional_variable('PROFILER_SLOWEST_PER_HOUR', 0))
+PROFILER_SAMPLE_RATE = float(__optional_variable('PROFILER_SAMPLE_RATE', 0.05))
+
+# Memory diagnostics (tracemalloc snapshots / cache sizes, reports are written to the memory dir)
+MEMORY_DIR = __optional_variable('MEMORY_DIR', path.join(gettempdir(), 'fin4dummy-memory'))
+MEMORY_SNAPSHOT_INTERVAL = int(__optional_variable('MEMORY_SNAPSHOT_INTERVAL', 0))
+MEMORY_TRACE_FRAMES = int(__optional_variable('MEMORY_TRACE_FRAMES', 1))
+MEMORY_TOP_SITES = int(__optional_variable('MEMORY_TOP_SITES', 25))
+
+# Tracing (fraction of requests traced, spans are exported to a json lines file or an OTLP collector)
+TRACE_SAMPLE_RATE = float(__optional_variable('TRACE_SAMPLE_RATE', 0))
+TRACE_EXPORTER = __optional_variable('TRACE_EXPORTER', 'jsonl')
+TRACE_FILE = __optional_variable('TRACE_FILE', path.join(gettempdir(), 'fin4dummy-traces.jsonl'))
+TRACE_OTLP_ENDPOINT = __optional_variable('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+
+# Password hashing (werkzeug method / salt length), hashes are upgraded on login when they change.
+# Verifications beyond the workers + queue are rejected (503) rather than queued
+PASSWORD_HASH_METHOD = __optional_variable("PASSWORD_HASH_METHOD", "pbkdf2:sha256:150000")
+PASSWORD_SALT_LENGTH = int(__optional_variable("PASSWORD_SALT_LENGTH", 16))
+PASSWORD_HASH_WORKERS = int(__optional_variable("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(__optional_variable("PASSWORD_HASH_QUEUE", 16))
+
+# Number of proxies (e.g. nginx) in front of the app whose X-Forwarded-For / X-Forwarded-Proto headers
+# are trusted for the client address, leave 0 when clients reach the app directly (they can set them)
+PROXY_COUNT = int(__optional_variable("PROXY_COUNT", 0))
+
+# Rate limits per route budget (name=count/seconds, a burst of count then count per seconds) counted
+# per JWT identity or client address (the login / register / reset / otp pages count their posts).
+# Buckets are kept in memory or shared through the database
+RATE_LIMITS = __optional_variable("RATE_LIMITS", "token=10/60,refresh=30/60,market=20/1,portfolio=20/1,login=10/60,register=5/300,reset=5/300,otp=10/300")
+RATE_LIMIT_BACKEND = __optional_variable("RATE_LIMIT_BACKEND", "memory")
+
+# Response compression (brotli when installed, gzip otherwise) of the json / static responses of at least
+# the min size (bytes), disable when a proxy compresses. Precompressed static assets are served as they are.
+# The html pages aren't compressed as they'd leak their CSRF token / JWT (BREACH)
+COMPRESS_ENABLED = __optional_variable("COMPRESS_ENABLED", "True").lower() == "true"
+COMPRESS_MIN_SIZE = int(__optional_variable("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_GZIP_LEVEL = int(__optional_variable("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(__optional_variable("COMPRESS_BROTLI_QUALITY", 4))
+
+# JSON API serializer (auto uses orjson when installed, json otherwise)
+JSON_SERIALIZER = __optional_variable("JSON_SERIALIZER", "auto")
+
 # Ensure templates are auto-reloaded
 if __is_present("FLASK_ENV") and environ.get("FLASK_ENV") == "development":
 	TEMPLATES_AUTO_RELOAD = True
 
-# Configure session to use filesystem (instead of signed cookies)
-SESSION_FILE_DIR = mkdtemp()
+# Configure session to be stored in the database (instead of signed cookies). Sessions expire
+# after the lifetime (minutes) of inactivity, expired sessions are swept every interval (seconds)
 SESSION_PERMANENT = False
-SESSION_TYPE = "filesystem"
+SESSION_LIFETIME = int(__optional_variable("SESSION_LIFETIME", 120))
+SESSION_SWEEP_INTERVAL = int(__optional_variable("SESSION_SWEEP_INTERVAL", 300))
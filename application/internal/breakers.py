@@ -0,0 +1,149 @@
+"""Upstream circuit breakers."""
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Dict
+
+from cachetools import LRUCache
+
+from .metrics import metrics
+
+class CircuitBreaker:
+    """ Tracks the outcome of the last calls to an upstream service. Once enough of them
+        failed or were slow the circuit opens and calls fail fast (Open) for a while, then
+        a single probe call is let through (half open) which closes the circuit again when
+        it succeeds """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    STATES = (CLOSED, HALF_OPEN, OPEN)
+
+    class Open(Exception):
+        """ Indicates the call wasn't made as the circuit is open """
+        pass
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 10, error_rate: float = 0.5,
+            slow: float = 2.0, open_seconds: float = 30):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow = slow
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=window)
+        self.opened = 0
+        self.probing = False
+        self.lock = Lock()
+
+    def __transition(self, state: str) -> None:
+        """ Must hold the lock """
+        print(f"Circuit {self.name} {self.state} -> {state}")
+        _transitions.inc(self.name, state)
+        self.state = state
+        if state == self.OPEN:
+            self.opened = time.monotonic()
+        elif state == self.CLOSED:
+            self.outcomes.clear()
+
+    def acquire(self) -> None:
+        """ Raises Open when the call may not be made """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened >= self.open_seconds:
+                self.__transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+        _rejected.inc(self.name)
+        raise self.Open(f"{self.name} circuit is {self.state}")
+
+    def record(self, failed: bool) -> None:
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.probing = False
+                self.__transition(self.OPEN if failed else self.CLOSED)
+                return
+
+            self.outcomes.append(failed)
+            if self.state == self.CLOSED and len(self.outcomes) >= self.min_calls \
+                    and sum(self.outcomes) >= self.error_rate * len(self.outcomes):
+                self.__transition(self.OPEN)
+
+    @contextmanager
+    def call(self, ignore: Callable[[Exception], bool] = None):
+        """ Guards the call, exceptions raised by the block (other than the ignored ones,
+            e.g. client errors) and calls slower than the slow threshold count as failures """
+        self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(ignore is None or not ignore(e))
+            raise
+        self.record(time.perf_counter() - start > self.slow)
+
+class Breakers:
+    """ The circuit breakers of the upstream services (iex, ipinfo, twilio, smtp) and the
+        last known good results served while their service is failing """
+
+    def __init__(self, app=None):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.settings = {}
+        self.timeout = None
+        self.lock = Lock()
+        self.last_good = LRUCache(maxsize=1024)
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.timeout = app.config["UPSTREAM_TIMEOUT"]
+        self.settings = {
+            "window": app.config["BREAKER_WINDOW"],
+            "min_calls": app.config["BREAKER_MIN_CALLS"],
+            "error_rate": app.config["BREAKER_ERROR_RATE"],
+            "slow": app.config["BREAKER_SLOW_MS"] / 1000,
+            "open_seconds": app.config["BREAKER_OPEN_SECONDS"]
+        }
+        self.last_good = LRUCache(maxsize=app.config["UPSTREAM_FALLBACK_SIZE"])
+
+    def __getitem__(self, service: str) -> CircuitBreaker:
+        breaker = self.breakers.get(service)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.setdefault(service, CircuitBreaker(service, **self.settings))
+        return breaker
+
+    def call(self, service: str, ignore: Callable[[Exception], bool] = None):
+        return self[service].call(ignore)
+
+    def remember(self, key: str, value) -> None:
+        """ Keeps the result as the last known good one """
+        with self.lock:
+            self.last_good[key] = value
+
+    def fallback(self, service: str, key: str, default=None):
+        """ The last known good result, the default when there isn't one """
+        with self.lock:
+            value = self.last_good.get(key)
+        if value is None:
+            return default
+        _fallbacks.inc(service)
+        return value
+
+breakers = Breakers()
+
+_state = metrics.gauge("circuit_breaker_state", "Circuit state (0 closed, 1 half open, 2 open)", ("service",))
+_transitions = metrics.counter("circuit_breaker_transitions_total", "Circuit state changes", ("service", "state"))
+_rejected = metrics.counter("circuit_breaker_rejected_total", "Calls failed fast by the open circuit", ("service",))
+_fallbacks = metrics.counter("upstream_fallbacks_total", "Last known good results served for failed calls", ("service",))
+
+@metrics.collector
+def _collect() -> None:
+    for name, breaker in list(breakers.breakers.items()):
+        _state.set(CircuitBreaker.STATES.index(breaker.state), name)
@@ -0,0 +1,99 @@
+"""HTTP caching."""
+import hashlib
+import os
+
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Tuple
+
+from flask import request, make_response
+
+class CachePolicy:
+    """ Per route HTTP caching. Static assets are linked with a fingerprint of their content
+        (url_for('static', ...) adds it) and cached for a year, JSON APIs are revalidated with
+        ETags derived from a cheap version of their data (answered 304 without running the
+        view) and everything else (the user's pages, the other JSON responses, the tokens)
+        isn't stored """
+
+    # Cache-Control of the fingerprinted static assets, the other assets are revalidated
+    IMMUTABLE = "public, max-age=31536000, immutable"
+    REVALIDATE = "no-cache"
+    SENSITIVE = "no-cache, no-store, must-revalidate"
+
+    def __init__(self, app=None):
+        self.fingerprints: Dict[str, Tuple[float, str]] = {}
+        self.lock = Lock()
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.static_folder = app.static_folder
+        app.url_defaults(self.__fingerprint)
+        app.after_request(self.__apply)
+
+    def fingerprint(self, filename: str) -> str:
+        """ Digest of the static asset's content, recomputed when the file changes """
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return ""
+
+        cached = self.fingerprints.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as asset:
+                cached = (mtime, hashlib.blake2b(asset.read(), digest_size=8).hexdigest())
+            with self.lock:
+                self.fingerprints[filename] = cached
+        return cached[1]
+
+    def __fingerprint(self, endpoint: str, values: Dict) -> None:
+        if endpoint == "static" and "filename" in values and not "v" in values:
+            fingerprint = self.fingerprint(values["filename"])
+            if fingerprint:
+                values["v"] = fingerprint
+
+    def __apply(self, response):
+        if request.endpoint == "static":
+            fingerprint = request.args.get("v")
+            immutable = fingerprint and fingerprint == self.fingerprint(request.view_args["filename"])
+            response.headers["Cache-Control"] = self.IMMUTABLE if immutable else self.REVALIDATE
+        elif not "Cache-Control" in response.headers:
+            self.__no_store(response)
+        return response
+
+    def __no_store(self, response) -> None:
+        response.headers["Cache-Control"] = self.SENSITIVE
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
+
+    def sensitive(self, fn):
+        """ Decorates a view whose responses must never be stored whatever the defaults (the
+            tokens, RFC 6749 5.1) """
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            response = make_response(fn(*args, **kwargs))
+            self.__no_store(response)
+            return response
+        return wrapper
+
+    def conditional(self, version: Callable[[], object]):
+        """ Decorates a JSON view whose response only changes with the version, the ETag is
+            derived from the url and the version so a matching If-None-Match is answered 304
+            without running the view. Apply after the jwt decorator when the version is per user """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                etag = hashlib.blake2b(f"{request.full_path}:{version()}".encode(), digest_size=12).hexdigest()
+                # Weak comparison as compressed responses carry the weak form of the etag
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response("", 304)
+                else:
+                    response = make_response(fn(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag)
+                response.headers["Cache-Control"] = f"private, {self.REVALIDATE}"
+                return response
+            return wrapper
+        return decorator
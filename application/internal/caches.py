@@ -0,0 +1,54 @@
+"""Application caches."""
+from typing import Dict, List, Tuple
+
+from cachetools import TTLCache
+
+from .metrics import metrics
+
+class MeteredTTLCache(TTLCache):
+    """ Named TTL cache keeping track of its hits and misses. The counts are plain
+        integers (approximate under contention) to keep lookups cheap """
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self.name = name
+        self.base_ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        registry[name] = self
+
+    def __getitem__(self, key):
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+    def stretch(self, factor: float) -> None:
+        """ Scales the ttl of the entries added from now on to the base ttl times the factor """
+        self._TTLCache__ttl = self.base_ttl * factor
+
+    def entries(self) -> List[Tuple]:
+        """ The (key, value) entries which haven't expired, without counting them as lookups """
+        entries = []
+        for key in list(self):
+            try:
+                entries.append((key, super().__getitem__(key)))
+            except KeyError:
+                pass
+        return entries
+
+# The caches by name
+registry: Dict[str, MeteredTTLCache] = {}
+
+_hits = metrics.counter("cache_hits_total", "Cache lookups served from the cache", ("cache",))
+_misses = metrics.counter("cache_misses_total", "Cache lookups which missed the cache", ("cache",))
+_entries = metrics.gauge("cache_entries", "Entries currently held by the cache", ("cache",))
+
+@metrics.collector
+def _collect() -> None:
+    for name, cache in registry.items():
+        _hits.set(cache.hits, name)
+        _misses.set(cache.misses, name)
+        _entries.set(cache.currsize, name)
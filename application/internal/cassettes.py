@@ -0,0 +1,96 @@
+"""Upstream record / replay."""
+import glob
+import json
+import os
+import time
+
+from threading import Lock
+from typing import Dict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+class Cassettes:
+    """ Records the responses of the upstream services (IEX, ipinfo, Twilio, SMTP) to disk
+        and replays them without a network. Responses are keyed by service and url (or the
+        natural key of the call) with the API token stripped. Replayed responses are served
+        from memory after the configured latency (per service) to model production """
+
+    LIVE = "live"
+    RECORD = "record"
+    REPLAY = "replay"
+
+    class Missing(Exception):
+        """ Indicates no response was recorded for the call """
+        pass
+
+    def __init__(self, app=None):
+        self.mode = self.LIVE
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.mode = app.config["UPSTREAM_MODE"]
+        self.dir = app.config["CASSETTE_DIR"]
+        self.latency = self.__latency(app.config["REPLAY_LATENCY_MS"])
+        self.lock = Lock()
+        self.tapes = {}
+        if self.mode == self.REPLAY:
+            self.load()
+
+    @staticmethod
+    def __latency(latencies: str) -> Dict[str, float]:
+        """ Parses the service latencies (service=ms,...), * applies to any other service """
+        latency = {}
+        for entry in filter(None, latencies.split(",")):
+            service, _, ms = entry.partition("=")
+            latency[service.strip()] = float(ms) / 1000
+        return latency
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == self.RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == self.REPLAY
+
+    @staticmethod
+    def key(url: str) -> str:
+        """ The url without the token """
+        parts = urlsplit(url)
+        query = urlencode([(name, value) for name, value in parse_qsl(parts.query) if name != "token"])
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+    def load(self) -> None:
+        """ Loads the recorded responses. They're kept serialized so replays can't share state """
+        tapes = {}
+        for path in glob.glob(os.path.join(self.dir, "*.json")):
+            with open(path) as tape:
+                service = os.path.splitext(os.path.basename(path))[0]
+                tapes[service] = {key: json.dumps(value) for key, value in json.load(tape).items()}
+        self.tapes = tapes
+
+    def delay(self, service: str) -> None:
+        """ Waits the replay latency of the service. Replayed sends (mail / sms) only wait """
+        delay = self.latency.get(service, self.latency.get("*", 0))
+        if delay:
+            time.sleep(delay)
+
+    def play(self, service: str, key: str):
+        """ The recorded response, raises Missing if the call wasn't recorded """
+        self.delay(service)
+        response = self.tapes.get(service, {}).get(key)
+        if response is None:
+            raise self.Missing(f"No {service} response recorded for {key}")
+        return json.loads(response)
+
+    def record(self, service: str, key: str, response) -> None:
+        """ Records the response writing the service's tape to disk """
+        with self.lock:
+            tape = self.tapes.setdefault(service, {})
+            tape[key] = json.dumps(response)
+
+            os.makedirs(self.dir, exist_ok=True)
+            with open(os.path.join(self.dir, f"{service}.json"), "w") as out:
+                json.dump({key: json.loads(value) for key, value in tape.items()}, out, indent=1)
+
+cassettes = Cassettes()
@@ -0,0 +1,118 @@
+"""Response compression."""
+import gzip
+import mimetypes
+import os
+
+from typing import Optional
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class Compression:
+    """ Compresses the (json / text / static) responses with brotli or gzip, whichever the client
+        prefers of the available ones. Responses smaller than the minimum size aren't worth it.
+        Static assets are served from their precompressed (.br / .gz) siblings when they have
+        them (manage.py compress_static), other static files and streamed responses are sent
+        as they are. The html pages aren't compressed, they render the CSRF token (and the JWT)
+        next to reflected input which compression would leak (BREACH) """
+
+    TYPES = ("text/css", "text/plain", "text/javascript", "application/javascript",
+        "application/json", "image/svg+xml", "image/x-icon")
+
+    SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.enabled = app.config["COMPRESS_ENABLED"]
+        self.min_size = app.config["COMPRESS_MIN_SIZE"]
+        self.gzip_level = app.config["COMPRESS_GZIP_LEVEL"]
+        self.brotli_quality = app.config["COMPRESS_BROTLI_QUALITY"]
+        self.encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+        self.static_folder = app.static_folder
+        if self.enabled:
+            app.before_request(self.__precompressed)
+            app.after_request(self.__compress)
+
+    def negotiate(self) -> Optional[str]:
+        """ The encoding of the response (br / gzip) according to the client's preferences """
+        return request.accept_encodings.best_match(self.encodings)
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, self.gzip_level)
+
+    def __precompressed(self):
+        if request.endpoint != "static":
+            return None
+
+        filename = request.view_args["filename"]
+        accepted = request.accept_encodings
+        for encoding in sorted((encoding for encoding in self.SUFFIXES if accepted[encoding]), key=lambda encoding: -accepted[encoding]):
+            precompressed = filename + self.SUFFIXES[encoding]
+            try:
+                # Siblings older than the asset are stale
+                if os.stat(os.path.join(self.static_folder, precompressed)).st_mtime < os.stat(os.path.join(self.static_folder, filename)).st_mtime:
+                    continue
+            except (OSError, ValueError):
+                continue
+
+            response = send_from_directory(self.static_folder, precompressed,
+                mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            return response
+        return None
+
+    def __compress(self, response):
+        if response.direct_passthrough or response.is_streamed or not 200 <= response.status_code < 300 \
+                or "Content-Encoding" in response.headers or not response.mimetype in self.TYPES:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.set_data(self.compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        # The compressed representation's no longer byte for byte the one the etag was made for
+        etag, weak = response.get_etag()
+        if not etag is None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    @classmethod
+    def compress_static(cls, folder: str, min_size: int = 512, gzip_level: int = 9, brotli_quality: int = 11) -> int:
+        """ Writes the precompressed (.gz and, when available, .br) siblings of the compressible
+            assets in the folder, returns the number of assets compressed """
+        compressed = 0
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith(tuple(cls.SUFFIXES.values())) or not mimetypes.guess_type(name)[0] in cls.TYPES:
+                    continue
+
+                path = os.path.join(root, name)
+                with open(path, "rb") as asset:
+                    data = asset.read()
+                if len(data) < min_size:
+                    continue
+
+                with open(path + ".gz", "wb") as out:
+                    out.write(gzip.compress(data, gzip_level, mtime=0))
+                if brotli is not None:
+                    with open(path + ".br", "wb") as out:
+                        out.write(brotli.compress(data, quality=brotli_quality))
+                compressed += 1
+        return compressed
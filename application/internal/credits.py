@@ -0,0 +1,170 @@
+"""Upstream credit budget."""
+import copy
+import time
+
+from collections import deque
+from functools import wraps
+from threading import Lock
+from typing import Dict, Iterable, Tuple
+
+from .metrics import metrics
+
+class CreditGovernor:
+    """ Keeps track of the IEX message credits spent per endpoint and projects the day's
+        burn from the spend so far plus the recent rate. As the projection approaches the
+        daily budget the governor conserves (the cache ttls are stretched and quotes are
+        fetched in batch calls) and then sheds the low priority fetches (news and market
+        lists) so the price fetches stay within the budget """
+
+    NORMAL = 0
+    CONSERVE = 1
+    SHED = 2
+
+    LEVELS = ("normal", "conserve", "shed")
+
+    LOW = "low"
+    HIGH = "high"
+
+    # Priority of the endpoints and whether a call costs a credit per item returned
+    ENDPOINTS: Dict[str, Tuple[str, bool]] = {
+        "quote": (HIGH, False),
+        "latest_price": (HIGH, False),
+        "batch_quote": (HIGH, True),
+        "news": (LOW, True),
+        "market_list": (LOW, True)
+    }
+
+    # Seconds of spend the recent rate is measured over (in minute buckets)
+    WINDOW = 900
+
+    class Shed(Exception):
+        """ Indicates the fetch was shed to stay within the budget """
+        pass
+
+    def __init__(self, app=None):
+        self.budget = 0
+        self.conserve_at = 0.8
+        self.shed_at = 0.9
+        self.stretch = 1
+        self.level = self.NORMAL
+        self.caches = []
+        self.lock = Lock()
+        self.__reset(self.__day())
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.budget = app.config["IEX_DAILY_CREDITS"]
+        self.conserve_at = app.config["IEX_CONSERVE_AT"]
+        self.shed_at = app.config["IEX_SHED_AT"]
+        self.stretch = app.config["IEX_TTL_STRETCH"]
+
+    @staticmethod
+    def __day() -> int:
+        return int(time.time() // 86400)
+
+    def __reset(self, day: int) -> None:
+        self.day = day
+        self.spent = {}
+        self.total = 0
+        self.minutes = deque()
+
+    def __roll(self) -> None:
+        """ Starts counting afresh when the (UTC) day changed, must hold the lock """
+        day = self.__day()
+        if day != self.day:
+            self.__reset(day)
+
+    def govern(self, caches: Iterable) -> None:
+        """ Registers the caches whose ttls are stretched while conserving """
+        self.caches.extend(caches)
+
+    def spend(self, endpoint: str, data) -> None:
+        """ Counts the credits of the endpoint's response """
+        per_item = self.ENDPOINTS.get(endpoint, (self.HIGH, False))[1]
+        credits = max(len(data), 1) if per_item and isinstance(data, (list, dict)) else 1
+        now = time.time()
+        minute = int(now // 60)
+        with self.lock:
+            self.__roll()
+            self.spent[endpoint] = self.spent.get(endpoint, 0) + credits
+            self.total += credits
+            minutes = self.minutes
+            if minutes and minutes[-1][0] == minute:
+                minutes[-1][1] += credits
+            else:
+                minutes.append([minute, credits])
+            while minutes[0][0] <= minute - self.WINDOW // 60:
+                minutes.popleft()
+        self.__adjust()
+
+    def projected(self) -> float:
+        """ The credits projected to be spent by the end of the (UTC) day """
+        now = time.time()
+        elapsed = now % 86400
+        window = max(min(self.WINDOW, elapsed), 60)
+        recent = sum(credits for minute, credits in list(self.minutes) if minute > (now - window) // 60)
+        return self.total + recent / window * (86400 - elapsed)
+
+    def pressure(self) -> float:
+        """ The projected spend as a fraction of the budget (0 without a budget) """
+        return self.projected() / self.budget if self.budget > 0 else 0.0
+
+    def __adjust(self) -> None:
+        pressure = self.pressure()
+        level = self.SHED if pressure >= self.shed_at else self.CONSERVE if pressure >= self.conserve_at else self.NORMAL
+        if level == self.level:
+            return
+
+        print(f"IEX credits {self.LEVELS[level]} (projected {self.projected():.0f} of {self.budget})")
+        self.level = level
+        for cache in self.caches:
+            cache.stretch(self.stretch if level > self.NORMAL else 1)
+
+    @property
+    def batching(self) -> bool:
+        """ Whether quotes should be fetched in batch calls """
+        return self.level > self.NORMAL
+
+    def check(self, endpoint: str) -> None:
+        """ Raises Shed when the endpoint's fetches are being shed """
+        if self.level != self.SHED or self.ENDPOINTS.get(endpoint, (self.HIGH, False))[0] != self.LOW:
+            return
+
+        # Re-evaluated as only the spend adjusts the level otherwise
+        with self.lock:
+            self.__roll()
+        self.__adjust()
+        if self.level == self.SHED:
+            _shed.inc(endpoint)
+            raise self.Shed()
+
+def sheddable(default):
+    """ Decorates a (cached) fetch to return a copy of the default when it's shed, shed
+        fetches aren't cached so they're fetched again once the pressure eases """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except CreditGovernor.Shed:
+                return copy.copy(default)
+        return wrapper
+    return decorator
+
+governor = CreditGovernor()
+
+_spent = metrics.gauge("iex_credits_spent", "IEX credits spent today", ("endpoint",))
+_projected = metrics.gauge("iex_credits_projected", "IEX credits projected to be spent today")
+_budget = metrics.gauge("iex_credits_budget", "Daily IEX credit budget (0 when ungoverned)")
+_level = metrics.gauge("iex_credits_governor_level", "Governor level (0 normal, 1 conserve, 2 shed)")
+_shed = metrics.counter("iex_fetches_shed_total", "IEX fetches shed to stay within the budget", ("endpoint",))
+
+@metrics.collector
+def _collect() -> None:
+    spent = governor.spent
+    for endpoint in CreditGovernor.ENDPOINTS:
+        _spent.set(spent.get(endpoint, 0), endpoint)
+    _projected.set(governor.projected())
+    _budget.set(governor.budget)
+    _level.set(governor.level)
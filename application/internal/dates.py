@@ -1,5 +1,5 @@
 """Application date utilities."""
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from dateutil import tz
 
 class Dates:
@@ -11,6 +11,12 @@ class Dates:
         utc = utc.replace(tzinfo=utc_zone)
         return utc.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
 
+    @staticmethod
+    def days_ago_utc_str(days: int) -> str:
+        """The time the number of days ago in UTC as a string in ISO format"""
+        utc = datetime.utcnow() - timedelta(days=days)
+        return utc.replace(tzinfo=tz.gettz('UTC')).strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+
     @staticmethod
     def now_eastern() -> datetime:
         """Current Us/Eastern date time"""
@@ -1,14 +1,21 @@
 """ Application emails"""
-import os
 import smtplib
-import ssl
 import html2text
 
+from queue import Queue, Empty, Full
+from threading import Thread
+from typing import List, Optional
+
 from flask import render_template
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from .urls import URLs
+from .metrics import upstream
+from .tracing import span
+from .cassettes import cassettes
+from .smtppool import SMTPPool
+from .breakers import breakers, CircuitBreaker
 
 class Mail:
     def __init__(self, email_to: str, subject: str, html: str):
@@ -47,7 +54,8 @@ class UnrecognizedAccessMail(Mail):
             render_template("/email/unrecognized_access.html", location=details, reset_url=URLs.change_password_url(token)))
 
 class Emails:
-    """ Email Service."""
+    """ Email Service. Mails are queued and sent by background senders, each sending the
+        mails queued (up to the batch size) over one pooled connection """
     def __init__(self, app=None):
         if app is not None:
             self.init(app)
@@ -57,10 +65,18 @@ class Emails:
         self.port = app.config["SMPT_PORT"]
         self.sender = app.config["SMPT_SENDER"]
         self.sender_pwd = app.config["SMPT_SENDER_PWD"]
-        self.sender_from = app.config["SMPT_SENDER_FROM"]            
+        self.sender_from = app.config["SMPT_SENDER_FROM"]
+        self.batch_size = app.config["MAIL_BATCH_SIZE"]
+        self.pool = SMTPPool(self.host, int(self.port), self.sender, self.sender_pwd, app.config["SMPT_POOL_SIZE"],
+            app.config["SMPT_SSL"], app.config["SMPT_MAX_IDLE"], guard=lambda: breakers.call("smtp"))
+
+        self.queue = Queue(maxsize=app.config["MAIL_QUEUE_SIZE"])
+        for i in range(app.config["MAIL_WORKERS"]):
+            Thread(target=self.__sender, name=f"mail-sender-{i}", daemon=True).start()
+        self.workers = app.config["MAIL_WORKERS"]
 
-    def __send_email(self, email_to: str, subject: str, html: str) -> None:
-        """Sends a multi-part email."""
+    def __message(self, email_to: str, subject: str, html: str) -> MIMEMultipart:
+        """Builds a multi-part email."""
 
         message = MIMEMultipart("alternative")
         message["From"] = self.sender_from
@@ -69,10 +85,85 @@ class Emails:
 
         message.attach(MIMEText(html2text.HTML2Text().handle(html), "plain"))
         message.attach(MIMEText(html, "html"))
+        return message
+
+    @staticmethod
+    def __client_error(e: Exception) -> bool:
+        """ Whether the mail was refused (e.g. a bad address) rather than the server failing """
+        return isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused))
+
+    def __send_email(self, server, mail: Mail) -> None:
+        """Sends the email over the connection."""
+        message = self.__message(mail.email_to, mail.subject, mail.html)
+        with upstream("smtp"), span("smtp", subject=mail.subject), breakers.call("smtp", self.__client_error):
+            refused = server.sendmail(self.sender, mail.email_to, message.as_string())
+            if cassettes.recording:
+                cassettes.record("smtp", f"{mail.email_to}:{mail.subject}", {"to": mail.email_to, "refused": list(refused)})
+
+    def send_batch(self, mails: List[Mail]) -> List[Optional[Exception]]:
+        """ Sends the mails over a pooled connection (reconnecting if it's dropped), returning
+            the error (or None) for each mail """
+        errors = [None] * len(mails)
+        if cassettes.replaying:
+            for _ in mails:
+                with upstream("smtp"):
+                    cassettes.delay("smtp")
+            return errors
+
+        # The mails left are retried once on a new connection in case the pooled one was stale
+        i = 0
+        for _ in range(2):
+            try:
+                with self.pool.connection() as server:
+                    while i < len(mails):
+                        try:
+                            self.__send_email(server, mails[i])
+                        except smtplib.SMTPServerDisconnected:
+                            raise
+                        except (smtplib.SMTPException, ValueError) as e:
+                            errors[i] = e
+                        i += 1
+                return errors
+            except (smtplib.SMTPException, OSError, CircuitBreaker.Open) as e:
+                error = e
+
+        for j in range(i, len(mails)):
+            errors[j] = error
+        return errors
+
+    def __sender(self) -> None:
+        while True:
+            mails = [self.queue.get()]
+            while len(mails) < self.batch_size:
+                try:
+                    mails.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            try:
+                for error in self.send_batch(mails):
+                    if not error is None:
+                        print(str(error))
+            except Exception as e:
+                print(str(e))
+            finally:
+                for _ in mails:
+                    self.queue.task_done()
 
-        with smtplib.SMTP_SSL(self.host, self.port) as server:
-            server.login(self.sender, self.sender_pwd)
-            server.sendmail(self.sender, email_to, message.as_string())
-        
     def send(self, mail: Mail) -> None:
-        self.__send_email(mail.email_to, mail.subject, mail.html)
+        """ Queues the mail, it's sent on the request when there aren't any senders or the
+            queue is full """
+        if self.workers > 0:
+            try:
+                self.queue.put_nowait(mail)
+                return
+            except Full:
+                pass
+
+        error, = self.send_batch([mail])
+        if not error is None:
+            raise error
+
+    def join(self) -> None:
+        """ Waits for the queued mails to be sent """
+        self.queue.join()
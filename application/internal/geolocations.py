@@ -1,38 +1,125 @@
 import ipinfo
+import os
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from whatsmyip.ip import get_ip
 from whatsmyip.providers import GoogleDnsProvider
 from flask import request
 
+from .metrics import upstream
+from .tracing import span
+from .cassettes import cassettes, Cassettes
+from .caches import MeteredTTLCache
+from .georanges import GeoRanges
+from .breakers import breakers, CircuitBreaker
+
 class GeoLocations:
     """ GeoLocation Service."""
+
+    # Cache key of the machine's own (public) address
+    LOCAL = "local"
+
     def __init__(self, app=None):
         if app is not None:
             self.init(app)
 
     def init(self, app) -> None:
         self.token = app.config["IPINFO_TOKEN"]
+        self.handler = ipinfo.getHandler(self.token)
+        self.cache = MeteredTTLCache("geolocations", maxsize=app.config["GEO_CACHE_SIZE"], ttl=app.config["GEO_CACHE_TTL"])
+        self.executor = ThreadPoolExecutor(max_workers=app.config["GEO_WORKERS"], thread_name_prefix="geo")
+        self.database = app.config["GEO_DATABASE"]
+        self.reload_interval = app.config["GEO_RELOAD_INTERVAL"]
+        self.ranges = None
+        self.ranges_mtime = None
+        self.checked = 0
+        if self.database:
+            self.reload()
 
-    def location(self):
-        """ Determines the location of the client accounting for typical proxy settings.
-            In the event the request is coming from the same machine / loop back ip
-            we'll attempt to resolve the actual IP address for the machine """
-        
+    def reload(self) -> bool:
+        """ (Re)loads the offline database if it changed, returns whether it was loaded """
+        self.checked = time.monotonic()
+        try:
+            mtime = os.stat(self.database).st_mtime
+            if mtime == self.ranges_mtime:
+                return False
+            # The replaced table is left to be collected as lookups may still be using it
+            self.ranges = GeoRanges(self.database)
+            self.ranges_mtime = mtime
+            return True
+        except (OSError, ValueError, GeoRanges.BadDatabase) as e:
+            print(str(e))
+            return False
+
+    def __offline(self, remote_addr: str):
+        if not self.database:
+            return None
+        if time.monotonic() - self.checked > self.reload_interval:
+            self.reload()
+        return None if self.ranges is None else self.ranges.lookup(remote_addr)
+
+    @staticmethod
+    def remote_addr() -> str:
+        """ The address of the client accounting for typical proxy settings """
         if 'X-Real-IP' in request.headers:
-            remote_addr = request.headers.get('X-Real-IP')
+            return request.headers.get('X-Real-IP')
         elif 'X-Forwarded-For' in request.headers:
-            remote_addr = request.headers.getlist("X-Forwarded-For")[0].rpartition(' ')[-1]
-        else:
-            remote_addr = getattr(request, "remote_addr", "untrackable")
+            return request.headers.getlist("X-Forwarded-For")[0].rpartition(' ')[-1]
+        return getattr(request, "remote_addr", None) or "untrackable"
+
+    def __public_addr(self, remote_addr: str) -> str:
+        """ In the event the request is coming from the same machine / loop back ip we'll
+            attempt to resolve the actual IP address for the machine """
+        if remote_addr != "127.0.0.1" and not remote_addr.startswith("192.168."):
+            return remote_addr
 
-        if remote_addr == "127.0.0.1" or remote_addr.startswith("192.168."):
+        public_addr = self.cache.get(self.LOCAL)
+        if public_addr is None:
             try:
-                remote_addr = get_ip(GoogleDnsProvider)
+                with span("whatsmyip"):
+                    public_addr = get_ip(GoogleDnsProvider)
+                self.cache[self.LOCAL] = public_addr
             except Exception as e:
                 print(str(e))
-                remote_addr = "untrackable"
-        
-        details = None
-        if remote_addr != "untrackable":
-            details = ipinfo.getHandler(self.token).getDetails(remote_addr).all
+                public_addr = "untrackable"
+        return public_addr
+
+    def lookup(self, remote_addr: str):
+        """ The location details of the address from the offline database, falling back to 
+            ipinfo (memoized per address) for the addresses it doesn't cover """
+        remote_addr = self.__public_addr(remote_addr)
+        if remote_addr == "untrackable":
+            return None
+
+        details = self.cache.get(remote_addr) or self.__offline(remote_addr)
+        if details is not None:
+            return details
+
+        with upstream("ipinfo"), span("ipinfo"):
+            if cassettes.replaying:
+                try:
+                    details = cassettes.play("ipinfo", remote_addr)
+                except Cassettes.Missing as e:
+                    print(str(e))
+            else:
+                try:
+                    with breakers.call("ipinfo"):
+                        details = self.handler.getDetails(remote_addr).all
+                except CircuitBreaker.Open as e:
+                    print(str(e))
+                    return None
+                if cassettes.recording:
+                    cassettes.record("ipinfo", remote_addr, details)
+
+        if details is not None:
+            self.cache[remote_addr] = details
         return details
+
+    def location(self):
+        """ Determines the location of the client """
+        return self.lookup(self.remote_addr())
+
+    def submit(self, fn, *args):
+        """ Runs the function off the request on the geolocation workers """
+        return self.executor.submit(fn, *args)
@@ -0,0 +1,117 @@
+"""Offline IP geolocation."""
+import bisect
+import csv
+import ipaddress
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from typing import Dict, Optional
+
+class GeoRanges:
+    """ Sorted (IPv4) address range table memory mapped from a compiled database file.
+        Lookups are a binary search over the range starts. The file is laid out as
+            GEO1 | count | starts[count] | ends[count] | offsets[count + 1] | records
+        where the numbers are little endian uint32 and each record is the utf-8
+        city, region, country and loc separated by tabs. On little endian hosts the numbers
+        are read in place, others decode them into arrays """
+
+    MAGIC = b"GEO1"
+    FIELDS = ("city", "region", "country", "loc")
+
+    class BadDatabase(Exception):
+        """ Indicates the file isn't a compiled database """
+        pass
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as database:
+            self.mmap = mmap.mmap(database.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[:4] != self.MAGIC:
+            self.mmap.close()
+            raise self.BadDatabase(f"{path} isn't a geo database")
+
+        count, = struct.unpack_from("<I", self.mmap, 4)
+        self.view = memoryview(self.mmap)
+        offset = 8
+        self.starts = self.__uint32s(offset, count)
+        offset += count * 4
+        self.ends = self.__uint32s(offset, count)
+        offset += count * 4
+        self.offsets = self.__uint32s(offset, count + 1)
+        self.records = offset + (count + 1) * 4
+        self.count = count
+
+    def __uint32s(self, offset: int, count: int):
+        """ The little endian uint32s at the offset, cast in place when the native layout matches """
+        if sys.byteorder == "little" and struct.calcsize("I") == 4:
+            return self.view[offset:offset + count * 4].cast("I")
+        return array("I", struct.unpack_from(f"<{count}I", self.mmap, offset))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup(self, remote_addr: str) -> Optional[Dict[str, str]]:
+        """ The location details of the address, None if it isn't within a range """
+        try:
+            address = int(ipaddress.IPv4Address(remote_addr))
+        except ValueError:
+            return None
+
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i < 0 or address > self.ends[i]:
+            return None
+
+        record = self.mmap[self.records + self.offsets[i]:self.records + self.offsets[i + 1]]
+        details = dict(zip(self.FIELDS, record.decode().split("\t")))
+        details["ip"] = remote_addr
+        return details
+
+    def close(self) -> None:
+        for numbers in (self.starts, self.ends, self.offsets):
+            if isinstance(numbers, memoryview):
+                numbers.release()
+        self.view.release()
+        self.mmap.close()
+
+    @staticmethod
+    def __address(value: str) -> int:
+        return int(value) if value.isdigit() else int(ipaddress.ip_address(value))
+
+    @classmethod
+    def compile(cls, source: str, path: str) -> int:
+        """ Compiles the csv of ranges (start, end, city, region, country, loc or ipinfo's
+            start_ip, end_ip, ..., latitude, longitude export) into the database, replacing it
+            atomically so running apps can reload it. Returns the number of ranges """
+        ranges = []
+        with open(source, newline="", encoding="utf-8") as ranges_csv:
+            for row in csv.DictReader(ranges_csv):
+                start = row.get("start_ip") or row["start"]
+                end = row.get("end_ip") or row["end"]
+                if ":" in start:
+                    continue
+                loc = row.get("loc") or f"{row['latitude']},{row['longitude']}"
+                record = "\t".join([row["city"], row["region"], row["country"], loc]).encode()
+                ranges.append((cls.__address(start), cls.__address(end), record))
+        ranges.sort()
+
+        records = bytearray()
+        offsets = [0]
+        for _, _, record in ranges:
+            records += record
+            offsets.append(len(records))
+
+        count = len(ranges)
+        temp = f"{path}.tmp"
+        with open(temp, "wb") as out:
+            out.write(cls.MAGIC)
+            out.write(struct.pack("<I", count))
+            out.write(struct.pack(f"<{count}I", *[start for start, _, _ in ranges]))
+            out.write(struct.pack(f"<{count}I", *[end for _, end, _ in ranges]))
+            out.write(struct.pack(f"<{count + 1}I", *offsets))
+            out.write(records)
+        os.replace(temp, path)
+        return count
@@ -0,0 +1,155 @@
+"""Local IEX stub."""
+import json
+import time
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Dict, List, Union
+from urllib.parse import urlsplit, parse_qs, unquote_plus
+
+def reference_price(symbol: str) -> float:
+    """ Deterministic price for the symbol (between $5 and $500) """
+    return round(5 + (zlib.crc32(symbol.encode()) % 49500) / 100, 2)
+
+def stub_quote(symbol: str) -> Dict[str, Union[str, float]]:
+    price = reference_price(symbol)
+    change = round(price * ((zlib.crc32(symbol[::-1].encode()) % 200) - 100) / 2000, 2)
+    return {
+        "symbol": symbol,
+        "companyName": f"{symbol} Inc.",
+        "latestPrice": price,
+        "open": round(price - change, 2),
+        "high": round(price + abs(change), 2),
+        "low": round(price - abs(change), 2),
+        "previousClose": round(price - change, 2),
+        "change": change,
+        "changePercent": round(change / price, 4),
+        "peRatio": 20.5,
+        "week52High": round(price * 1.4, 2),
+        "week52Low": round(price * 0.6, 2),
+        "ytdChange": 0.12
+    }
+
+def stub_news(symbol: str) -> List[Dict[str, str]]:
+    return [{"headline": f"{symbol} headline {i}", "summary": f"{symbol} summary {i}", "lang": "en",
+        "source": "stub", "url": "http://localhost", "datetime": 0} for i in range(3)]
+
+class StubMarket:
+    """ Deterministic quotes, the prices never move """
+    MARKET_LISTS = ["AAPL", "MSFT", "AMZN", "TSLA", "F", "GE", "AMD", "NIO", "BAC", "T"]
+
+    def quote(self, symbol: str) -> Dict[str, Union[str, float]]:
+        return stub_quote(symbol)
+
+    def latest_price(self, symbol: str) -> float:
+        return reference_price(symbol)
+
+    def news(self, symbol: str) -> List[Dict[str, str]]:
+        return stub_news(symbol)
+
+    def market_list(self, name: str) -> List[Dict[str, Union[str, float]]]:
+        return [stub_quote(symbol) for symbol in self.MARKET_LISTS]
+
+    def wait(self, tick: int, timeout: float) -> int:
+        """ Waits for the tick after the specified one, returning the current tick """
+        time.sleep(timeout)
+        return tick
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        parts = [unquote_plus(part) for part in url.path.split("/") if part][1:]
+        args = parse_qs(url.query)
+        if parts and parts[0] in ("stocksUS", "stocksUSNoUTP"):
+            self.stream(self.symbols(args))
+            return
+
+        body = self.route(parts, args)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def symbols(args: Dict[str, List[str]]) -> List[str]:
+        return [symbol for symbol in args.get("symbols", [""])[0].split(",") if symbol]
+
+    def route(self, parts: List[str], args: Dict[str, List[str]]):
+        market = self.server.market
+        if parts[:3] == ["stock", "market", "batch"]:
+            return {symbol: {"quote": market.quote(symbol)} for symbol in self.symbols(args)}
+        elif parts[:3] == ["stock", "market", "list"] and len(parts) == 4:
+            return market.market_list(parts[3])
+        elif len(parts) >= 3 and parts[0] == "stock":
+            symbol = parts[1]
+            if parts[2:] == ["quote", "latestPrice"]:
+                return market.latest_price(symbol)
+            elif parts[2:] == ["quote"]:
+                return market.quote(symbol)
+            elif parts[2] == "news":
+                return market.news(symbol)
+        return None
+
+    def stream(self, symbols: List[str]) -> None:
+        """ Server sent events, the quotes of the symbols are sent every tick (as IEX's
+            stocksUS stream) with a comment as a heartbeat while nothing changes """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        market = self.server.market
+        tick = -1
+        try:
+            while not self.server.stopped:
+                current = market.wait(tick, 15)
+                if current == tick:
+                    self.wfile.write(b": heartbeat\n\n")
+                else:
+                    tick = current
+                    data = json.dumps([market.quote(symbol) for symbol in symbols])
+                    self.wfile.write(f"data: {data}\n\n".encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+class IEXStub:
+    """ Local stand-in for the subset of IEX cloud used by Stocks (and the stocksUS sse
+        stream). Quotes come from the market, by default deterministic prices so runs
+        are comparable (used by the benchmarks) or a MarketSimulator """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, market=None):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.market = StubMarket() if market is None else market
+        self.server.stopped = False
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/stable"
+
+    def start(self) -> "IEXStub":
+        Thread(target=self.server.serve_forever, name="iex-stub", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.stopped = True
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,121 @@
+"""SQL instrumentation."""
+import logging
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class QueryStats:
+    """ SQL statistics for a unit of work (typically a request) """
+    def __init__(self, slowest: int, repeated: int):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.slowest_limit = slowest
+        self.repeated_limit = repeated
+        self.__slowest = []
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+        slowest = self.__slowest
+        if len(slowest) < self.slowest_limit or seconds > slowest[-1][0]:
+            slowest.append((seconds, statement))
+            slowest.sort(key=lambda stmt: stmt[0], reverse=True)
+            del slowest[self.slowest_limit:]
+
+    @property
+    def slowest(self) -> List[Tuple[float, str]]:
+        """ The slowest statements along with their execution time, slowest first """
+        return list(self.__slowest)
+
+    @property
+    def repeated(self) -> Dict[str, int]:
+        """ Identical statements executed repeatedly. Most likely N+1 patterns """
+        return {statement: count for statement, count in self.statements.items() if count >= self.repeated_limit}
+
+class SQLInstrumentation:
+    """ Records the number of queries, the time spent in the DB and the slowest statements
+        per request. Statements repeated within a request are flagged as probable N+1 patterns,
+        requests spending longer than the threshold in the DB are logged as warnings """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.enabled = app.config["SQL_INSTRUMENTATION"]
+        self.slowest = app.config["SQL_SLOWEST_STATEMENTS"]
+        self.repeated = app.config["SQL_REPEATED_STATEMENTS"]
+        self.slow_request = app.config["SQL_SLOW_REQUEST_MS"] / 1000
+        # Own logger (propagating to the app's handlers) so the per request stats can be logged in production
+        self.logger = app.logger.getChild("sql")
+        self.logger.setLevel(app.config["SQL_LOG_LEVEL"].upper())
+        self.headers = app.debug
+        if not self.enabled:
+            return
+
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+        app.before_request(self.__start)
+        app.after_request(self.__finish)
+
+    def __start(self) -> None:
+        g.sql_stats = QueryStats(self.slowest, self.repeated)
+
+    def __finish(self, response):
+        stats = g.pop("sql_stats", None)
+        if stats is None:
+            return response
+
+        repeated = stats.repeated
+        if self.headers:
+            response.headers["X-SQL-Count"] = str(stats.count)
+            response.headers["X-SQL-Time"] = f"{stats.seconds * 1000:.2f}ms"
+            response.headers["X-SQL-Repeated"] = str(len(repeated))
+
+        # Requests spending longer than the threshold in the DB are logged as warnings
+        slow = self.slow_request > 0 and stats.seconds >= self.slow_request
+        self.logger.log(logging.WARNING if slow else logging.INFO, "%s %s: %d queries in %.2fms",
+            request.method, request.path, stats.count, stats.seconds * 1000)
+        for seconds, statement in stats.slowest:
+            self.logger.log(logging.WARNING if slow else logging.DEBUG, "%s %s: %.2fms %s",
+                request.method, request.path, seconds * 1000, statement)
+        for statement, count in repeated.items():
+            self.logger.warning("%s %s: probable N+1, executed %d times: %s", request.method, request.path, count, statement)
+        return response
+
+    @contextmanager
+    def capture(self):
+        """ Captures the statements executed within the block. Used to catch query regressions,
+            must be called within the app context
+
+            with sql.capture() as stats:
+                ...
+            assert stats.count <= 2 and not stats.repeated """
+        previous = g.get("sql_stats")
+        g.sql_stats = QueryStats(self.slowest, self.repeated)
+        try:
+            yield g.sql_stats
+        finally:
+            g.sql_stats = previous
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    if not has_app_context():
+        return
+
+    stats = g.get("sql_stats")
+    if not stats is None:
+        stats.record(statement, seconds)
@@ -0,0 +1,157 @@
+"""Synthetic market data."""
+import math
+import random
+import string
+import time
+import zlib
+
+from threading import Condition, Thread
+from typing import Dict, List, Union
+
+from .iexstub import reference_price
+
+class _Symbol:
+    __slots__ = ("symbol", "price", "open", "high", "low", "previous_close", "week52_high",
+        "week52_low", "volatility", "volume", "updated")
+
+    def __init__(self, symbol: str, rand: random.Random):
+        price = reference_price(symbol)
+        self.symbol = symbol
+        self.price = price
+        self.open = price
+        self.high = price
+        self.low = price
+        self.previous_close = round(price * rand.uniform(0.97, 1.03), 2)
+        self.week52_high = round(price * rand.uniform(1.05, 1.8), 2)
+        self.week52_low = round(price * rand.uniform(0.4, 0.95), 2)
+        self.volatility = rand.uniform(0.15, 0.9)
+        self.volume = 0
+        self.updated = int(time.time() * 1000)
+
+class MarketSimulator:
+    """ Simulates the prices of the symbols with a seeded geometric brownian motion moving
+        every tick. Symbols the app asks for that aren't simulated yet are added on demand.
+        speed is the simulated seconds per real second so price moves over a trading day can
+        be compressed into minutes """
+
+    # Simulated seconds in a trading year (252 days of 6.5 hours)
+    YEAR = 252 * 6.5 * 3600
+
+    def __init__(self, symbols: int = 500, tick_ms: int = 1000, seed: int = 1, speed: float = 1.0, drift: float = 0.05):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.tick_ms = tick_ms
+        self.dt = tick_ms / 1000 * speed / self.YEAR
+        self.drift = drift
+        self.tick = 0
+        self.changed = Condition()
+        self.running = False
+        self.state: Dict[str, _Symbol] = {}
+        for symbol in self.__symbols(symbols):
+            self.__add(symbol)
+
+    def __symbols(self, count: int) -> List[str]:
+        """ Generates the (unique) symbols, 1 to 4 letters """
+        symbols = []
+        seen = set()
+        while len(symbols) < count:
+            symbol = "".join(self.random.choice(string.ascii_uppercase) for _ in range(self.random.randint(1, 4)))
+            if not symbol in seen:
+                seen.add(symbol)
+                symbols.append(symbol)
+        return symbols
+
+    def __add(self, symbol: str) -> _Symbol:
+        state = _Symbol(symbol, random.Random(zlib.crc32(symbol.encode()) ^ self.seed))
+        self.state[symbol] = state
+        return state
+
+    def __get(self, symbol: str) -> _Symbol:
+        state = self.state.get(symbol)
+        if state is None:
+            with self.changed:
+                state = self.state.get(symbol) or self.__add(symbol)
+        return state
+
+    def step(self) -> None:
+        """ Moves every price one tick """
+        gauss = self.random.gauss
+        dt = self.dt
+        sqrt_dt = math.sqrt(dt)
+        now = int(time.time() * 1000)
+        with self.changed:
+            for state in list(self.state.values()):
+                sigma = state.volatility
+                price = state.price * math.exp((self.drift - sigma * sigma / 2) * dt + sigma * sqrt_dt * gauss(0, 1))
+                price = max(0.01, round(price, 2))
+                state.price = price
+                state.high = max(state.high, price)
+                state.low = min(state.low, price)
+                state.volume += int(self.random.expovariate(1 / 500))
+                state.updated = now
+            self.tick += 1
+            self.changed.notify_all()
+
+    def __run(self) -> None:
+        interval = self.tick_ms / 1000
+        next_tick = time.perf_counter()
+        while self.running:
+            self.step()
+            next_tick += interval
+            time.sleep(max(0, next_tick - time.perf_counter()))
+
+    def start(self) -> "MarketSimulator":
+        self.running = True
+        Thread(target=self.__run, name="market-sim", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.running = False
+
+    def wait(self, tick: int, timeout: float) -> int:
+        """ Waits for the tick after the specified one, returning the current tick """
+        with self.changed:
+            self.changed.wait_for(lambda: self.tick != tick, timeout)
+            return self.tick
+
+    def quote(self, symbol: str) -> Dict[str, Union[str, float]]:
+        state = self.__get(symbol)
+        price = state.price
+        change = round(price - state.previous_close, 2)
+        return {
+            "symbol": symbol,
+            "companyName": f"{symbol} Inc.",
+            "latestPrice": price,
+            "latestUpdate": state.updated,
+            "open": state.open,
+            "high": state.high,
+            "low": state.low,
+            "previousClose": state.previous_close,
+            "change": change,
+            "changePercent": round(change / state.previous_close, 4),
+            "volume": state.volume,
+            "peRatio": round(price / max(0.01, state.open / 20), 2),
+            "week52High": max(state.week52_high, state.high),
+            "week52Low": min(state.week52_low, state.low),
+            "ytdChange": round(price / state.week52_low - 1, 4)
+        }
+
+    def latest_price(self, symbol: str) -> float:
+        return self.__get(symbol).price
+
+    def news(self, symbol: str) -> List[Dict[str, str]]:
+        quote = self.quote(symbol)
+        direction = "rises" if quote["change"] >= 0 else "falls"
+        return [{"headline": f"{symbol} {direction} {abs(quote['changePercent']) * 100:.2f}% ({i})",
+            "summary": f"{symbol} last traded at ${quote['latestPrice']:,.2f}", "lang": "en",
+            "source": "simulator", "url": "http://localhost", "datetime": quote["latestUpdate"]} for i in range(3)]
+
+    def market_list(self, name: str) -> List[Dict[str, Union[str, float]]]:
+        quotes = [self.quote(symbol) for symbol in list(self.state)]
+        if name == "gainers":
+            quotes.sort(key=lambda quote: quote["changePercent"], reverse=True)
+        elif name == "losers":
+            quotes.sort(key=lambda quote: quote["changePercent"])
+        else:
+            quotes.sort(key=lambda quote: quote["volume"], reverse=True)
+        return quotes[:10]
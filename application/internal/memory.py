@@ -0,0 +1,123 @@
+"""Memory diagnostics."""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Union
+
+from . import caches
+
+def approximate_size(obj, seen: set = None) -> int:
+    """ Approximate size in bytes of the object along with the containers / strings it references """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(key, seen) + approximate_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item, seen) for item in obj)
+    return size
+
+def rss() -> Optional[int]:
+    """ The resident set size of the process in bytes """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+class MemoryDiagnostics:
+    """ Memory diagnostics for long running workers. Snapshots of the traced allocations are
+        taken on demand or periodically, diffed against the previous one and reported along
+        with the entries / approximate size of each cache. Tracing starts with the first
+        snapshot. Reports (json) and snapshots are written to the memory directory """
+
+    IGNORE = [tracemalloc.Filter(False, tracemalloc.__file__),
+              tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+              tracemalloc.Filter(False, "<unknown>")]
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.dir = app.config["MEMORY_DIR"]
+        self.interval = app.config["MEMORY_SNAPSHOT_INTERVAL"]
+        self.frames = app.config["MEMORY_TRACE_FRAMES"]
+        self.top = app.config["MEMORY_TOP_SITES"]
+        self.lock = Lock()
+        self.previous = None
+
+        if self.interval > 0:
+            Thread(target=self.__periodic, name="memory-snapshots", daemon=True).start()
+
+    def __periodic(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.snapshot()
+            except Exception as e:
+                print(str(e))
+
+    def stop(self) -> None:
+        """ Stops tracing allocations """
+        with self.lock:
+            tracemalloc.stop()
+            self.previous = None
+
+    def cache_sizes(self) -> Dict[str, Dict[str, int]]:
+        """ The entries and approximate size of each cache """
+        sizes = {}
+        for name, cache in list(caches.registry.items()):
+            entries = cache.entries()
+            sizes[name] = {
+                "entries": len(entries),
+                "maxsize": cache.maxsize,
+                "bytes": approximate_size(entries)
+            }
+        return sizes
+
+    def snapshot(self) -> Dict[str, Union[str, int, List, Dict]]:
+        """ Takes a snapshot, writes it along with the report to disk and returns the report """
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+
+            snapshot = tracemalloc.take_snapshot().filter_traces(self.IGNORE)
+            current, peak = tracemalloc.get_traced_memory()
+            name = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+
+            report = {
+                "time": name,
+                "pid": os.getpid(),
+                "rss": rss(),
+                "traced": {"current": current, "peak": peak},
+                "top": [{"site": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:self.top]],
+                "diff": [] if self.previous is None else
+                    [{"site": str(stat.traceback), "bytes": stat.size_diff, "count": stat.count_diff}
+                        for stat in snapshot.compare_to(self.previous, "lineno")[:self.top]],
+                "caches": self.cache_sizes()
+            }
+            self.previous = snapshot
+
+            os.makedirs(self.dir, exist_ok=True)
+            path = os.path.join(self.dir, f"{os.getpid()}-{name}")
+            snapshot.dump(f"{path}.snapshot")
+            with open(f"{path}.json", "w") as out:
+                json.dump(report, out, indent=1)
+            report["snapshot"] = f"{path}.snapshot"
+            return report
@@ -0,0 +1,174 @@
+"""Application metrics."""
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Iterable, Sequence
+
+from flask import g, request
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+class Counter:
+    """ Monotonically increasing counter """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, value: float, *labels: str) -> None:
+        """ Sets the value. Used by collectors for counts owned elsewhere """
+        self.values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def lines(self) -> Iterable[str]:
+        for labels, value in list(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+class Gauge(Counter):
+    """ Value which can go up and down """
+    type = "gauge"
+
+class Histogram:
+    """ Distribution of observed values (typically latencies in seconds) """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            data = self.values.get(labels)
+            if data is None:
+                data = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    def count(self, *labels: str) -> int:
+        data = self.values.get(labels)
+        return 0 if data is None else data[2]
+
+    @contextmanager
+    def time(self, *labels: str):
+        """ Observes the time it takes to execute the block """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def lines(self) -> Iterable[str]:
+        for labels, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {count}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {count}"
+
+class Metrics:
+    """ Metrics registry. Metrics are cheap to update and rendered in the prometheus text
+        format when scraped. Collectors are called at scrape time to refresh gauges whose
+        values are owned elsewhere (e.g. cache statistics) """
+    def __init__(self):
+        self.__metrics = []
+        self.__collectors = []
+
+    def init(self, app) -> None:
+        self.token = app.config["METRICS_TOKEN"]
+        app.before_request(self.__start)
+        app.after_request(self.__finish)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.__register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.__register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.__register(Histogram(name, help, labels, buckets))
+
+    def collector(self, collect: Callable[[], None]) -> Callable[[], None]:
+        """ Registers a function called before the metrics are rendered """
+        self.__collectors.append(collect)
+        return collect
+
+    def __register(self, metric):
+        self.__metrics.append(metric)
+        return metric
+
+    def __start(self) -> None:
+        g.metrics_start = time.perf_counter()
+
+    def __finish(self, response):
+        start = g.pop("metrics_start", None)
+        if not start is None:
+            rule = request.url_rule.rule if request.url_rule else "unmatched"
+            _request_seconds.observe(time.perf_counter() - start, rule, request.method, str(response.status_code))
+        return response
+
+    def render(self) -> str:
+        """ The metrics in the prometheus text exposition format """
+        for collect in self.__collectors:
+            collect()
+
+        lines = []
+        append = lines.append
+        for metric in self.__metrics:
+            append(f"# HELP {metric.name} {metric.help}")
+            append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.lines())
+        append("")
+        return "\n".join(lines)
+
+metrics = Metrics()
+
+_request_seconds = metrics.histogram("http_request_duration_seconds", "Time spent handling requests",
+    ("route", "method", "status"))
+_upstream_seconds = metrics.histogram("upstream_request_duration_seconds", "Time spent calling upstream services",
+    ("service",))
+_upstream_errors = metrics.counter("upstream_errors_total", "Failed calls to upstream services",
+    ("service",))
+
+@contextmanager
+def upstream(service: str):
+    """ Times the call to the upstream service (iex, ipinfo, twilio, smtp) counting failures """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _upstream_errors.inc(service)
+        raise
+    finally:
+        _upstream_seconds.observe(time.perf_counter() - start, service)
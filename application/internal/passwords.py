@@ -0,0 +1,58 @@
+"""Password hashing."""
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from .tracing import span
+
+class Passwords:
+    """ Password hashing service. Hashes are computed on a bounded pool so a burst of logins
+        can't take every core from the other requests, hashes and verifications beyond the
+        queue limit are rejected (Busy) rather than queued behind the burst """
+
+    class Busy(Exception):
+        """ Indicates too many passwords are waiting to be hashed or verified """
+        pass
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.method = self.__normalize(app.config["PASSWORD_HASH_METHOD"])
+        self.salt_length = app.config["PASSWORD_SALT_LENGTH"]
+        workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self.slots = BoundedSemaphore(workers + app.config["PASSWORD_HASH_QUEUE"])
+
+    @staticmethod
+    def __normalize(method: str) -> str:
+        """ The method with werkzeug's default pbkdf2 iterations made explicit """
+        if method.startswith("pbkdf2:") and method.count(":") == 1:
+            return f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+        return method
+
+    def __submit(self, name: str, fn, *args):
+        """ Runs fn on the pool, raises Busy when the queue is full """
+        if not self.slots.acquire(blocking=False):
+            raise self.Busy()
+        try:
+            with span(name):
+                return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password: str) -> str:
+        """ Hashes the password, raises Busy when the queue is full """
+        return self.__submit("password.hash", generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """ Verifies the password, raises Busy when the queue is full """
+        return self.__submit("password.verify", check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """ Whether the hash was generated with other parameters than the configured ones """
+        method, _, rest = pwhash.partition("$")
+        salt = rest.partition("$")[0]
+        return self.__normalize(method) != self.method or len(salt) != self.salt_length
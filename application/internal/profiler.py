@@ -0,0 +1,104 @@
+"""Request profiler."""
+import cProfile
+import heapq
+import os
+import random
+import re
+import time
+
+from datetime import datetime
+from threading import Lock
+from typing import Callable
+from uuid import uuid4
+
+from flask import g, request, session
+from flask_jwt_extended import get_jwt_identity
+
+class Profiler:
+    """ CPU profiler for individual requests. An admin can profile any request on demand
+        with the X-Profile: 1 header (or __profile=1 query arg). Optionally a sample of
+        requests is profiled keeping the profiles of the N slowest per hour. Profiles are
+        written to the profile directory in the pstats format. Nothing is hooked into the
+        request handling unless the profiler is enabled """
+
+    HEADER = "X-Profile"
+    ARG = "__profile"
+
+    def __init__(self, app=None, authorize: Callable[[], bool] = None):
+        if app is not None:
+            self.init(app, authorize)
+
+    def init(self, app, authorize: Callable[[], bool] = None) -> None:
+        self.enabled = app.config["PROFILER_ENABLED"]
+        if not self.enabled:
+            return
+
+        self.dir = app.config["PROFILER_DIR"]
+        self.slowest = app.config["PROFILER_SLOWEST_PER_HOUR"]
+        self.sample_rate = app.config["PROFILER_SAMPLE_RATE"]
+        self.authorize = authorize or (lambda: False)
+        self.lock = Lock()
+        self.hour = None
+        self.kept = []
+        os.makedirs(self.dir, exist_ok=True)
+
+        app.before_request(self.__start)
+        app.after_request(self.__finish)
+
+    def __requested(self) -> bool:
+        return request.headers.get(self.HEADER) == "1" or request.args.get(self.ARG) == "1"
+
+    def __start(self) -> None:
+        on_demand = self.__requested() and self.authorize()
+        if on_demand or (self.slowest > 0 and random.random() < self.sample_rate):
+            profile = cProfile.Profile()
+            g.profile = (profile, time.perf_counter(), on_demand)
+            profile.enable()
+
+    def __finish(self, response):
+        data = g.pop("profile", None)
+        if data is None:
+            return response
+
+        profile, start, on_demand = data
+        profile.disable()
+        seconds = time.perf_counter() - start
+
+        if on_demand:
+            response.headers["X-Profile-File"] = os.path.basename(self.__write(profile, seconds))
+        elif self.__is_slowest(seconds):
+            self.__keep(seconds, self.__write(profile, seconds))
+        return response
+
+    def __is_slowest(self, seconds: float) -> bool:
+        """ Whether the request is one of the slowest sampled this hour """
+        hour = int(time.time() // 3600)
+        with self.lock:
+            if hour != self.hour:
+                self.hour = hour
+                self.kept = []
+            return len(self.kept) < self.slowest or seconds > self.kept[0][0]
+
+    def __keep(self, seconds: float, path: str) -> None:
+        """ Keeps the profile removing the fastest one kept this hour once over the limit """
+        with self.lock:
+            heapq.heappush(self.kept, (seconds, path))
+            if len(self.kept) <= self.slowest:
+                return
+            _, path = heapq.heappop(self.kept)
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(str(e))
+
+    def __write(self, profile: cProfile.Profile, seconds: float) -> str:
+        """ Writes the profile tagged with the route, user id and duration """
+        rule = request.url_rule.rule if request.url_rule else "unmatched"
+        route = re.sub(r"[^A-Za-z0-9]+", "_", rule).strip("_") or "index"
+        user_id = session.get("user_id") or get_jwt_identity() or "anonymous"
+        name = "-".join([datetime.utcnow().strftime("%Y%m%dT%H%M%S"), route, f"u{user_id}",
+            f"{seconds * 1000:.0f}ms", uuid4().hex[:6]])
+
+        path = os.path.join(self.dir, f"{name}.prof")
+        profile.dump_stats(path)
+        return path
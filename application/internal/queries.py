@@ -0,0 +1,18 @@
+"""Application queries."""
+from flask import current_app
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy.orm import raiseload
+
+class LoadingPolicyQuery(BaseQuery):
+    """ Query enforcing the relationship loading policy. When strict loading is enabled
+        (testing) every relationship which wasn't explicitly loaded with a loader option
+        (selectinload, joinedload, ...) raises when accessed instead of lazy loading """
+
+    _strict = False
+
+    def __iter__(self):
+        if not self._strict and current_app.config["SQLALCHEMY_STRICT_LOADING"]:
+            query = self.options(raiseload("*"))
+            query._strict = True
+            return iter(query)
+        return super().__iter__()
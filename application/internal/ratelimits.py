@@ -0,0 +1,155 @@
+"""Rate limiting."""
+import math
+import time
+
+from functools import wraps
+from threading import Lock, Thread
+from typing import Callable, Dict, Tuple
+
+from flask import request, jsonify, make_response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import case, select
+from sqlalchemy.exc import IntegrityError
+
+from .metrics import metrics
+
+_limited = metrics.counter("rate_limited_total", "Requests rejected by the rate limiter", ("limit",))
+
+class MemoryBuckets:
+    """ Buckets of this process. A bucket is its theoretical arrival time (GCRA), the time
+        at which it'll be full again, so taking a token is a comparison and an addition """
+
+    def __init__(self):
+        self.tats = {}
+        self.lock = Lock()
+
+    def take(self, key: str, interval: float, tolerance: float) -> float:
+        """ Takes a token, returns 0 or the seconds until one is available """
+        now = time.monotonic()
+        with self.lock:
+            tat = max(self.tats.get(key, now), now) + interval
+            if tat - now > tolerance:
+                return tat - now - tolerance
+            self.tats[key] = tat
+        return 0
+
+    def sweep(self) -> int:
+        """ Forgets the full buckets, returns the number forgotten """
+        now = time.monotonic()
+        with self.lock:
+            full = [key for key, tat in self.tats.items() if tat <= now]
+            for key in full:
+                del self.tats[key]
+        return len(full)
+
+class DatabaseBuckets:
+    """ Buckets shared by the workers through the application database. Taking a token is
+        a single conditional update of the bucket's arrival time (epoch milliseconds) """
+
+    def __init__(self):
+        from ..models import RateLimits
+        from .. import db
+
+        self.db = db
+        self.table = RateLimits.__table__
+
+    def take(self, key: str, interval: float, tolerance: float) -> float:
+        now = int(time.time() * 1000)
+        interval = int(interval * 1000)
+        tolerance = int(tolerance * 1000)
+        table = self.table
+        tat = case([(table.c.tat > now, table.c.tat)], else_=now)
+        with self.db.engine.begin() as conn:
+            taken = conn.execute(table.update()
+                .where(table.c.bucket == key)
+                .where(tat <= now + tolerance - interval)
+                .values(tat=tat + interval)).rowcount
+            if taken:
+                return 0
+            current = conn.execute(select([table.c.tat]).where(table.c.bucket == key)).scalar()
+
+        if current is None:
+            try:
+                with self.db.engine.begin() as conn:
+                    conn.execute(table.insert().values(bucket=key, tat=now + interval))
+                return 0
+            except IntegrityError:
+                # Another worker created the bucket first
+                return self.take(key, interval / 1000, tolerance / 1000)
+        return max(max(current, now) + interval - now - tolerance, 1) / 1000
+
+    def sweep(self) -> int:
+        with self.db.engine.begin() as conn:
+            return conn.execute(self.table.delete().where(self.table.c.tat <= int(time.time() * 1000))).rowcount
+
+class RateLimiter:
+    """ Per route token bucket rate limits. Requests are counted against the JWT identity
+        or, for anonymous requests, the client address. The limits are named budgets of
+        count/seconds (name=count/seconds,...), a bucket holds up to count tokens and
+        refills at count per seconds. Routes of a budget without a limit aren't limited """
+
+    MEMORY = "memory"
+    DATABASE = "database"
+
+    # Seconds between forgetting the full buckets
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.limits = self.__limits(app.config["RATE_LIMITS"])
+        self.buckets = DatabaseBuckets() if app.config["RATE_LIMIT_BACKEND"] == self.DATABASE else MemoryBuckets()
+        if self.limits:
+            Thread(target=self.__sweeper, args=(app,), name="rate-limit-sweeper", daemon=True).start()
+
+    @staticmethod
+    def __limits(limits: str) -> Dict[str, Tuple[float, float]]:
+        """ Parses the limits (name=count/seconds,...) into the (interval, tolerance) per name """
+        parsed = {}
+        for entry in filter(None, limits.split(",")):
+            name, _, rate = entry.partition("=")
+            count, _, seconds = rate.partition("/")
+            parsed[name.strip()] = (float(seconds) / int(count), float(seconds))
+        return parsed
+
+    def hit(self, name: str) -> float:
+        """ Counts the request against the budget, returns 0 or the seconds to retry after """
+        limit = self.limits.get(name)
+        if limit is None:
+            return 0
+
+        # The proxy headers are only trusted through PROXY_COUNT (ProxyFix), clients can set them
+        identity = get_jwt_identity()
+        key = f"{name}:{identity}" if not identity is None else f"{name}@{request.remote_addr}"
+        retry_after = self.buckets.take(key, *limit)
+        if retry_after:
+            _limited.inc(name)
+        return retry_after
+
+    def limit(self, name: str, methods: Tuple[str, ...] = None, rejected: Callable[[], object] = None):
+        """ Decorates the view with the named budget, to be applied after the jwt decorator
+            so requests are counted against their identity. Only the requests of the methods
+            are counted (all when not specified), rejected requests are answered with the
+            rejected response (the pages) or a JSON 429 """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                retry_after = self.hit(name) if methods is None or request.method in methods else 0
+                if retry_after:
+                    response = make_response(jsonify({"msg": "Too many requests"}), 429) if rejected is None else make_response(rejected())
+                    response.headers["Retry-After"] = str(math.ceil(retry_after))
+                    return response
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def __sweeper(self, app) -> None:
+        while True:
+            time.sleep(self.SWEEP_INTERVAL)
+            try:
+                with app.app_context():
+                    self.buckets.sweep()
+            except Exception as e:
+                print(str(e))
@@ -0,0 +1,75 @@
+"""JSON serialization."""
+import json
+
+from datetime import date
+from decimal import Decimal
+from operator import attrgetter
+from typing import Dict, Iterable, List
+
+from flask import current_app
+from sqlalchemy import inspect
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class Columns:
+    """ Precompiled extractor of a model's columns (optionally only some of them). The
+        column attributes are resolved once instead of being reflected for every row
+        (dictalchemy's asdict) """
+
+    def __init__(self, model, only: Iterable[str] = None):
+        only = None if only is None else set(only)
+        props = [prop for prop in inspect(model).column_attrs if only is None or prop.key in only]
+        self.keys = tuple(prop.key for prop in props)
+        self.attributes = tuple(prop.class_attribute for prop in props)
+        getter = attrgetter(*self.keys)
+        self.getter = getter if len(self.keys) > 1 else lambda instance: (getter(instance),)
+
+    def __call__(self, instance) -> Dict:
+        return dict(zip(self.keys, self.getter(instance)))
+
+    def rows(self, query) -> List[Dict]:
+        """ Selects only the columns of the query's rows, no instances are loaded """
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in query.with_entities(*self.attributes)]
+
+class JSONSerializer:
+    """ Serializes the JSON API responses with orjson when it's installed (and selected),
+        the standard library json otherwise. Output is compact and keys aren't sorted """
+
+    BACKENDS = ("auto", "orjson", "json")
+
+    def __init__(self, app=None):
+        self.backend = "json"
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        backend = app.config["JSON_SERIALIZER"]
+        if not backend in self.BACKENDS:
+            raise ValueError(f"Unknown JSON serializer {backend}, expected one of {', '.join(self.BACKENDS)}")
+        if backend == "orjson" and orjson is None:
+            print("orjson isn't installed, falling back to json")
+        self.backend = "orjson" if backend != "json" and orjson is not None else "json"
+
+    @staticmethod
+    def __default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        if isinstance(o, date):
+            return o.isoformat()
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+    def encode(self, obj) -> bytes:
+        if self.backend == "orjson":
+            return orjson.dumps(obj, default=self.__default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=self.__default, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def dumps(self, obj) -> str:
+        return self.encode(obj).decode()
+
+    def jsonify(self, obj):
+        """ The JSON response of the object (drop in for flask's jsonify) """
+        return current_app.response_class(self.encode(obj), mimetype="application/json")
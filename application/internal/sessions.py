@@ -0,0 +1,124 @@
+"""Database sessions."""
+import secrets
+import time
+import zlib
+
+from threading import Thread
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import select
+from werkzeug.datastructures import CallbackDict
+
+class DatabaseSession(CallbackDict, SessionMixin):
+    """ Session stored server side, only the id is sent as the cookie """
+    def __init__(self, sid: str, data=None, blob: bytes = None, expiry: int = 0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.blob = blob
+        self.expiry = expiry
+        self.modified = False
+
+class DatabaseSessions(SessionInterface):
+    """ Stores the sessions in the application database so they survive restarts and are
+        shared across workers / nodes. Sessions are serialized as (tagged) json, compressed
+        once they're large enough to benefit, and only written when their content changed
+        or their expiry needs to be extended. Expired sessions are swept by a background
+        thread """
+
+    # Serialized sessions larger than this are compressed
+    COMPRESS_SIZE = 256
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        from ..models import Sessions
+        from .. import db
+
+        self.db = db
+        self.table = Sessions.__table__
+        self.lifetime = app.config["SESSION_LIFETIME"] * 60
+        app.session_interface = self
+
+        interval = app.config["SESSION_SWEEP_INTERVAL"]
+        if interval > 0:
+            Thread(target=self.__sweeper, args=(app, interval), name="session-sweeper", daemon=True).start()
+
+    def __dumps(self, session: DatabaseSession) -> bytes:
+        data = self.serializer.dumps(dict(session)).encode()
+        if len(data) > self.COMPRESS_SIZE:
+            return b"z" + zlib.compress(data)
+        return b"j" + data
+
+    def __loads(self, blob: bytes):
+        data = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+        return self.serializer.loads(data.decode())
+
+    def open_session(self, app, request) -> DatabaseSession:
+        sid = request.cookies.get(app.session_cookie_name)
+        if not sid:
+            return DatabaseSession(secrets.token_urlsafe(32))
+
+        table = self.table
+        with self.db.engine.connect() as conn:
+            row = conn.execute(select([table.c.data, table.c.expiry]).where(table.c.id == sid)).first()
+        if row is None or row.expiry <= time.time():
+            # Unknown sessions get a new id rather than the one the client sent
+            return DatabaseSession(secrets.token_urlsafe(32))
+
+        try:
+            return DatabaseSession(sid, self.__loads(row.data), row.data, row.expiry)
+        except (ValueError, zlib.error) as e:
+            print(str(e))
+            return DatabaseSession(secrets.token_urlsafe(32))
+
+    def save_session(self, app, session: DatabaseSession, response) -> None:
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        table = self.table
+        if not session:
+            if session.blob is not None:
+                with self.db.engine.begin() as conn:
+                    conn.execute(table.delete().where(table.c.id == session.sid))
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+
+        now = int(time.time())
+        # Compared serialized as nested values can be changed without marking the session modified
+        blob = self.__dumps(session)
+        # The expiry is extended once half the lifetime has passed rather than every request
+        refresh = session.expiry - now < self.lifetime / 2
+        if blob == session.blob and not refresh:
+            return
+
+        expiry = now + self.lifetime
+        with self.db.engine.begin() as conn:
+            if session.blob is None:
+                conn.execute(table.insert().values(id=session.sid, data=blob, expiry=expiry))
+            else:
+                conn.execute(table.update().where(table.c.id == session.sid).values(data=blob, expiry=expiry))
+
+        if session.blob is None:
+            response.set_cookie(app.session_cookie_name, session.sid, expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                secure=self.get_cookie_secure(app), samesite=app.config["SESSION_COOKIE_SAMESITE"])
+
+    def sweep(self) -> int:
+        """ Deletes the expired sessions, returns the number deleted """
+        with self.db.engine.begin() as conn:
+            return conn.execute(self.table.delete().where(self.table.c.expiry <= int(time.time()))).rowcount
+
+    def __sweeper(self, app, interval: int) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    self.sweep()
+            except Exception as e:
+                print(str(e))
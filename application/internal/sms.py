@@ -1,4 +1,11 @@
+from twilio.base.exceptions import TwilioException, TwilioRestException
 from twilio.rest import Client 
+from typing import List, Optional
+
+from .metrics import upstream
+from .tracing import span
+from .cassettes import cassettes
+from .breakers import breakers, CircuitBreaker
 
 class SMS:
     def __init__(self, to: str, message: str):
@@ -20,10 +27,34 @@ class SMSs:
         self.sid = app.config["TWILIO_SID"]
         self.token = app.config["TWILIO_TOKEN"]
         self.number = app.config["TWILIO_NUMBER"]
+        self.client = Client(self.sid, self.token)
+
+    @staticmethod
+    def __client_error(e: Exception) -> bool:
+        """ Whether the message was rejected (e.g. a bad number) rather than twilio failing """
+        return isinstance(e, TwilioRestException) and e.status < 500
 
     def __send_sms(self, to: str, message: str) -> None:
-        client = Client(self.sid, self.token)
-        client.messages.create(from_=self.number, body=message, to=to)
+        with upstream("twilio"), span("twilio"):
+            if cassettes.replaying:
+                cassettes.delay("twilio")
+                return
+
+            with breakers.call("twilio", self.__client_error):
+                sent = self.client.messages.create(from_=self.number, body=message, to=to)
+            if cassettes.recording:
+                cassettes.record("twilio", sent.sid, {"to": to, "status": sent.status})
 
     def send(self, sms: SMS) -> None:
         self.__send_sms(sms.to, sms.message)
+
+    def send_batch(self, messages: List[SMS]) -> List[Optional[Exception]]:
+        """ Sends the messages, returning the error (or None) for each message """
+        errors = []
+        for sms in messages:
+            try:
+                self.__send_sms(sms.to, sms.message)
+                errors.append(None)
+            except (TwilioException, OSError, CircuitBreaker.Open) as e:
+                errors.append(e)
+        return errors
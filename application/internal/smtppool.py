@@ -0,0 +1,96 @@
+"""SMTP connection pool."""
+import smtplib
+import ssl
+import time
+
+from contextlib import contextmanager, nullcontext
+from queue import LifoQueue
+from typing import Callable, ContextManager
+
+class SMTPPool:
+    """ Bounded pool of logged in SMTP connections. Connections are created as they're
+        needed (up to the size) and reused most recently used first, connections that
+        were idle longer than max_idle are checked with a NOOP before they're reused. New
+        connections are made within the guard (e.g. a circuit breaker) """
+
+    def __init__(self, host: str, port: int, user: str, password: str, size: int = 2,
+            use_ssl: bool = True, max_idle: float = 30, timeout: float = 30,
+            guard: Callable[[], ContextManager] = nullcontext):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.guard = guard
+        self.slots = LifoQueue()
+        for _ in range(size):
+            self.slots.put((None, 0))
+
+    def __connect(self) -> smtplib.SMTP:
+        with self.guard():
+            if self.use_ssl:
+                server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+            else:
+                server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.password:
+                server.login(self.user, self.password)
+        return server
+
+    @staticmethod
+    def __healthy(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def __close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def acquire(self) -> smtplib.SMTP:
+        """ A connection from the pool, blocking until one is available """
+        server, last_used = self.slots.get()
+        try:
+            if not server is None and time.monotonic() - last_used > self.max_idle and not self.__healthy(server):
+                server.close()
+                server = None
+            return self.__connect() if server is None else server
+        except Exception:
+            self.slots.put((None, 0))
+            raise
+
+    def release(self, server: smtplib.SMTP, broken: bool = False) -> None:
+        """ Returns the connection to the pool, broken connections are closed """
+        if broken:
+            server.close()
+            self.slots.put((None, 0))
+        else:
+            self.slots.put((server, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        server = self.acquire()
+        broken = False
+        try:
+            yield server
+        except (smtplib.SMTPServerDisconnected, OSError):
+            broken = True
+            raise
+        finally:
+            self.release(server, broken)
+
+    def close(self) -> None:
+        """ Closes the idle connections """
+        slots = []
+        while not self.slots.empty():
+            server, _ = self.slots.get()
+            if not server is None:
+                self.__close(server)
+            slots.append((None, 0))
+        for slot in slots:
+            self.slots.put(slot)
@@ -1,16 +1,29 @@
 """Stock APIs."""
 from typing import Dict, List, Optional, Union
 
-from cachetools import cached, TTLCache
+from cachetools import cached
+from cachetools.keys import hashkey
 from googletrans import Translator
 from datetime import time
 
 from .utils import to_float, call_api, quote
 from .dates import Dates
+from .caches import MeteredTTLCache
+from .credits import governor, sheddable
 
 class Stocks:
     """ Stock API."""
 
+    # The maximum number of symbols IEX accepts per batch call
+    BATCH_LIMIT = 100
+
+    LATEST_PRICES = MeteredTTLCache("latest_price", maxsize=1000, ttl=900)
+    QUOTES = MeteredTTLCache("lookup", maxsize=1000, ttl=900)
+    NEWS = MeteredTTLCache("news", maxsize=100, ttl=900)
+    MOST_ACTIVE = MeteredTTLCache("most_active", maxsize=1, ttl=900)
+    BIGGEST_GAINERS = MeteredTTLCache("biggest_gainers", maxsize=1, ttl=900)
+    BIGGEST_LOSERS = MeteredTTLCache("biggest_losers", maxsize=1, ttl=900)
+
     @staticmethod
     def is_exchange_open() -> bool:
         """Determines if the exchange is open (doesn't account for holidays)"""
@@ -40,6 +53,8 @@ class Stocks:
 
     def init(self, app) -> None:
         self.iex_api_key = app.config["IEX_API_KEY"]
+        self.base_url = app.config["IEX_BASE_URL"]
+        governor.govern([self.LATEST_PRICES, self.QUOTES, self.NEWS, self.MOST_ACTIVE, self.BIGGEST_GAINERS, self.BIGGEST_LOSERS])
 
     def __defaults(self, data: Dict[str, Union[str, float]]) -> Dict[str, Union[str, float]]:
         # This is not ideal though the IEX doesn't update these during the day so we'll 
@@ -78,64 +93,149 @@ class Stocks:
                 "changePercent": round(to_float(data["changePercent"]) * 100, 2)}))
         return stocks
 
+    def __map_quote(self, data: Dict[str, str]) -> Dict[str, Union[str, float]]:
+        return self.__defaults({
+                "symbol": data["symbol"],
+                "name": data["companyName"],
+                "price": to_float(data["latestPrice"]),
+                "open" : to_float(data["open"]),
+                "high" : to_float(data["high"]),
+                "low" : to_float(data["low"]),
+                "previousClose" : to_float(data["previousClose"]), 
+                "change" : to_float(data["change"]),
+                "changePercent": round(to_float(data["changePercent"]) * 100, 2),
+                "peRatio": to_float(data["peRatio"]),
+                "52WeekHigh" : to_float(data["week52High"]),
+                "52WeekLow" : to_float(data["week52Low"]),
+                "ytdChange": round(to_float(data["ytdChange"]) * 100, 2)
+            })
+
+    def __map_batch_quotes(self, batch: Dict[str, Dict[str, Dict[str, str]]]) -> Dict[str, Dict[str, Union[str, float]]]:
+        return {symbol: self.__map_quote(data["quote"]) for symbol, data in batch.items()}
+
+    def __map_batch_prices(self, batch: Dict[str, Dict[str, Dict[str, str]]]) -> Dict[str, Dict[str, Union[str, float]]]:
+        prices = {}
+        for symbol, data in batch.items():
+            prices[symbol] = {
+                "name": data["quote"]["companyName"],
+                "price": to_float(data["quote"]["latestPrice"])
+            }
+        return prices
+
+    def __batch_quote_url(self, symbols: List[str]) -> str:
+        return f"{self.base_url}/stock/market/batch?symbols={','.join(quote(symbol) for symbol in symbols)}&types=quote&token={self.iex_api_key}"
+
     def __latest_price_url(self, symbol: str) -> str:
-        return f"https://cloud-sse.iexapis.com/stable/stock/{quote(symbol)}/quote/latestPrice?token={self.iex_api_key}"
+        return f"{self.base_url}/stock/{quote(symbol)}/quote/latestPrice?token={self.iex_api_key}"
 
     def __quote_url(self, symbol: str) -> str:
-        return f"https://cloud-sse.iexapis.com/stable/stock/{quote(symbol)}/quote?token={self.iex_api_key}"
+        return f"{self.base_url}/stock/{quote(symbol)}/quote?token={self.iex_api_key}"
 
     def __news_url(self, symbol: str) -> str:
-        return f"https://cloud-sse.iexapis.com/stable/stock/{quote(symbol)}/news/last/3?token={self.iex_api_key}"
+        return f"{self.base_url}/stock/{quote(symbol)}/news/last/3?token={self.iex_api_key}"
 
     def __most_active_url(self) -> str:
-        return f"https://cloud-sse.iexapis.com/stable/stock/market/list/mostactive?token={self.iex_api_key}"
+        return f"{self.base_url}/stock/market/list/mostactive?token={self.iex_api_key}"
 
     def __gainers_url(self) -> str:
-        return f"https://cloud-sse.iexapis.com/stable/stock/market/list/gainers?token={self.iex_api_key}"
+        return f"{self.base_url}/stock/market/list/gainers?token={self.iex_api_key}"
 
     def __losers_url(self) -> str:
-        return f"https://cloud-sse.iexapis.com/stable/stock/market/list/losers?token={self.iex_api_key}"
-
-    @cached(cache=TTLCache(maxsize=100, ttl=900))
+        return f"{self.base_url}/stock/market/list/losers?token={self.iex_api_key}"
+
+    def opening_prices(self, symbols: List[str]) -> Dict[str, Optional[Dict[str, Union[str, float]]]]:
+        """Look up the current name and price for each of the symbols in as few batch calls
+        as possible. The cache is bypassed as the prices are used to settle orders. The price
+        is None for unknown symbols, symbols which couldn't be fetched are left out."""
+        prices = {}
+        for i in range(0, len(symbols), self.BATCH_LIMIT):
+            chunk = symbols[i:i + self.BATCH_LIMIT]
+            fetched = call_api(self.__batch_quote_url(chunk), self.__map_batch_prices, endpoint="batch_quote")
+            if fetched is None:
+                continue
+            for symbol in chunk:
+                prices[symbol] = fetched.get(symbol)
+        return prices
+
+    def quotes(self, symbols: List[str]) -> Dict[str, Optional[Dict[str, Union[str, float]]]]:
+        """Look up the quotes for the symbols, the ones missing from the cache are fetched in as
+        few batch calls as possible (also caching their latest prices). The quote is None for
+        unknown symbols, symbols which couldn't be fetched are left out."""
+        quotes = {}
+        missing = []
+        cache = self.QUOTES
+        for symbol in symbols:
+            try:
+                quotes[symbol] = cache[hashkey(self, symbol)]
+            except KeyError:
+                missing.append(symbol)
+
+        for i in range(0, len(missing), self.BATCH_LIMIT):
+            chunk = missing[i:i + self.BATCH_LIMIT]
+            fetched = call_api(self.__batch_quote_url(chunk), self.__map_batch_quotes, endpoint="batch_quote")
+            if fetched is None:
+                continue
+            for symbol in chunk:
+                ticker = quotes[symbol] = fetched.get(symbol)
+                if not ticker is None:
+                    cache[hashkey(self, symbol)] = ticker
+                    self.LATEST_PRICES[hashkey(self, symbol)] = ticker["price"]
+        return quotes
+
+    def latest_prices(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        """Look up the latest prices for the symbols, the ones missing from the cache are quoted in
+        as few batch calls as possible. The price is None for unknown symbols, symbols which couldn't
+        be fetched are left out."""
+        prices = {}
+        missing = []
+        cache = self.LATEST_PRICES
+        for symbol in symbols:
+            try:
+                prices[symbol] = cache[hashkey(self, symbol)]
+            except KeyError:
+                missing.append(symbol)
+
+        if missing:
+            for symbol, ticker in self.quotes(missing).items():
+                prices[symbol] = None if ticker is None else ticker["price"]
+        return prices
+
+    def prefetch(self, symbols: List[str]) -> None:
+        """Under credit pressure the quotes missing from the cache are fetched up front in batch
+        calls rather than one or two calls per symbol."""
+        if governor.batching:
+            self.quotes(sorted(set(symbols)))
+
+    @cached(cache=LATEST_PRICES)
     def latest_price(self, symbol: str) -> Optional[float]:
         """Look up the latest price for symbol."""
-        return call_api(self.__latest_price_url(symbol), lambda data: to_float(data))
+        return call_api(self.__latest_price_url(symbol), lambda data: to_float(data), endpoint="latest_price", fallback=True)
 
-    @cached(cache=TTLCache(maxsize=100, ttl=900))
+    @cached(cache=QUOTES)
     def lookup(self, symbol: str) -> Optional[Dict[str, Union[str, float]]]:
         """Look up quote for symbol."""
-        return call_api(self.__quote_url(symbol), lambda data : self.__defaults({
-                "symbol": data["symbol"],
-                "name": data["companyName"],
-                "price": to_float(data["latestPrice"]),
-                "open" : to_float(data["open"]),
-                "high" : to_float(data["high"]),
-                "low" : to_float(data["low"]),
-                "previousClose" : to_float(data["previousClose"]), 
-                "change" : to_float(data["change"]),
-                "changePercent": round(to_float(data["changePercent"]) * 100, 2),
-                "peRatio": to_float(data["peRatio"]),
-                "52WeekHigh" : to_float(data["week52High"]),
-                "52WeekLow" : to_float(data["week52Low"]),
-                "ytdChange": round(to_float(data["ytdChange"]) * 100, 2)
-            }))
+        return call_api(self.__quote_url(symbol), self.__map_quote, endpoint="quote", fallback=True)
 
-    @cached(cache=TTLCache(maxsize=100, ttl=900))
+    @sheddable([])
+    @cached(cache=NEWS)
     def news(self, symbol: str) -> Optional[List[Dict[str, str]]]:
         """Look up news for symbol."""
-        return call_api(self.__news_url(symbol), self.__map_news)
+        return call_api(self.__news_url(symbol), self.__map_news, endpoint="news", fallback=True)
 
-    @cached(cache=TTLCache(maxsize=1, ttl=900))
+    @sheddable([])
+    @cached(cache=MOST_ACTIVE)
     def most_active(self: str) -> List[Dict[str, Union[str, float]]]:
         """Look up the most active stocks."""
-        return call_api(self.__most_active_url(), self.__map_market_data, [])
+        return call_api(self.__most_active_url(), self.__map_market_data, [], endpoint="market_list", fallback=True)
 
-    @cached(cache=TTLCache(maxsize=1, ttl=900))
+    @sheddable([])
+    @cached(cache=BIGGEST_GAINERS)
     def biggest_gainers(self: str) -> List[Dict[str, Union[str, float]]]:
         """Look up the biggest gainer stocks."""
-        return call_api(self.__gainers_url(), self.__map_market_data, [])
+        return call_api(self.__gainers_url(), self.__map_market_data, [], endpoint="market_list", fallback=True)
 
-    @cached(cache=TTLCache(maxsize=1, ttl=900))
+    @sheddable([])
+    @cached(cache=BIGGEST_LOSERS)
     def biggest_losers(self: str) -> List[Dict[str, Union[str, float]]]:
         """Look the biggest loser stocks."""
-        return call_api(self.__losers_url(), self.__map_market_data, [])
+        return call_api(self.__losers_url(), self.__map_market_data, [], endpoint="market_list", fallback=True)
@@ -0,0 +1,204 @@
+"""Request tracing."""
+import json
+import os
+import random
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from queue import Queue, Full
+from threading import Thread
+from typing import Dict, List, Optional
+
+import requests
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class Span:
+    """ Timed operation within a trace """
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start", "end", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = None if parent is None else parent.span_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+        trace.spans.append(self)
+
+    def finish(self) -> None:
+        self.end = time.time_ns()
+
+    @property
+    def duration(self) -> int:
+        """ Duration in nanoseconds, spans left open are treated as ending when they started """
+        return 0 if self.end is None else self.end - self.start
+
+    def asdict(self) -> Dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.start + self.duration,
+            "duration_ms": round(self.duration / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class Trace:
+    """ The spans of a single (sampled) request """
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+
+_current: ContextVar = ContextVar("span", default=None)
+
+@contextmanager
+def span(name: str, **attributes):
+    """ Opens a span nested under the current one. Does nothing unless the request is traced """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace, name, parent, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+class JSONLinesExporter:
+    """ Appends the spans to a local file, one json document per line """
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a") as out:
+            for span in spans:
+                out.write(json.dumps(span.asdict()))
+                out.write("\n")
+
+class OTLPExporter:
+    """ Posts the spans to an OTLP/HTTP (json) collector """
+    def __init__(self, endpoint: str, service: str):
+        self.endpoint = endpoint
+        self.service = service
+
+    @staticmethod
+    def __attribute(key: str, value) -> Dict:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        elif isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        elif isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def __span(self, span: Span) -> Dict:
+        data = {
+            "traceId": span.trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 2 if span.parent_id is None else 1,
+            "startTimeUnixNano": str(span.start),
+            "endTimeUnixNano": str(span.start + span.duration),
+            "attributes": [self.__attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": 1} if span.error is None else {"code": 2, "message": span.error}
+        }
+        if not span.parent_id is None:
+            data["parentSpanId"] = span.parent_id
+        return data
+
+    def export(self, spans: List[Span]) -> None:
+        requests.post(self.endpoint, timeout=5, json={"resourceSpans": [{
+            "resource": {"attributes": [self.__attribute("service.name", self.service)]},
+            "scopeSpans": [{"scope": {"name": self.service}, "spans": [self.__span(span) for span in spans]}]
+        }]})
+
+class Tracer:
+    """ Lightweight request tracing. A sample of the requests is traced, the spans opened
+        while handling the request (SQL, upstream calls, templates, ...) are nested under
+        the request span and exported on a background thread once the request completes """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init(app)
+
+    def init(self, app) -> None:
+        self.sample_rate = app.config["TRACE_SAMPLE_RATE"]
+        if self.sample_rate <= 0:
+            return
+
+        if app.config["TRACE_EXPORTER"] == "otlp":
+            self.exporter = OTLPExporter(app.config["TRACE_OTLP_ENDPOINT"], app.name)
+        else:
+            self.exporter = JSONLinesExporter(app.config["TRACE_FILE"])
+        self.queue = Queue(maxsize=1000)
+        Thread(target=self.__export, name="trace-exporter", daemon=True).start()
+
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(Engine, "handle_error", _handle_error)
+
+        app.before_request(self.__start)
+        app.teardown_request(self.__finish)
+
+    def __start(self) -> None:
+        if random.random() < self.sample_rate:
+            root = Span(Trace(), f"{request.method} {request.path}", None, {"http.method": request.method,
+                "http.route": request.url_rule.rule if request.url_rule else "unmatched"})
+            g.trace = (root, _current.set(root))
+
+    def __finish(self, exc) -> None:
+        data = g.pop("trace", None)
+        if data is None:
+            return
+
+        root, token = data
+        if not exc is None:
+            root.error = type(exc).__name__
+        _current.reset(token)
+        root.finish()
+        try:
+            self.queue.put_nowait(root.trace.spans)
+        except Full:
+            pass
+
+    def __export(self) -> None:
+        while True:
+            spans = self.queue.get()
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                print(str(e))
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    parent = _current.get()
+    if not parent is None:
+        conn.info.setdefault("trace_spans", []).append(Span(parent.trace, "sql", parent, {"db.statement": statement}))
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    spans = conn.info.get("trace_spans")
+    if spans:
+        spans.pop().finish()
+
+def _handle_error(context) -> None:
+    spans = None if context.connection is None else context.connection.info.get("trace_spans")
+    if spans:
+        span = spans.pop()
+        span.error = type(context.original_exception).__name__
+        span.finish()
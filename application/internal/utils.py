@@ -3,6 +3,12 @@ import urllib.parse
 
 from typing import Optional
 
+from .metrics import upstream
+from .tracing import span
+from .cassettes import cassettes, Cassettes
+from .credits import governor
+from .breakers import breakers, CircuitBreaker
+
 def escape(s: str) -> str:
     for old, new in [("-", "--"), (" ", "-"), ("_", "__"), ("?", "~q"),
                         ("%", "~p"), ("#", "~h"), ("/", "~s"), ("\"", "''")]:
@@ -15,16 +21,41 @@ def quote(s: str) -> str:
 def to_float(value: Optional[str]) -> str:
     return 0.0 if value is None else float(value)
 
-def call_api(url, mapper=None, default_return_val=None):
+def client_error(e: Exception) -> bool:
+    """ Whether the request failed because of the request (e.g. an unknown symbol) """
+    return isinstance(e, requests.HTTPError) and not e.response is None and e.response.status_code < 500
+
+def call_api(url, mapper=None, default_return_val=None, service="iex", endpoint=None, fallback=False):
+    """ Calls the api, spending the endpoint's credits. Raises CreditGovernor.Shed when
+        the endpoint's fetches are being shed. With fallback the last known good result is
+        returned when the call fails (or its circuit is open) """
+    if not endpoint is None:
+        governor.check(endpoint)
+    key = Cassettes.key(url)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.RequestException as e:
+        with upstream(service), span(service, url=url.split("?")[0]):
+            if cassettes.replaying:
+                data = cassettes.play(service, key)
+            else:
+                with breakers.call(service, client_error):
+                    response = requests.get(url, timeout=breakers.timeout)
+                    response.raise_for_status()
+    except (requests.RequestException, Cassettes.Missing, CircuitBreaker.Open) as e:
         print(str(e))
-        return default_return_val
+        return breakers.fallback(service, key, default_return_val) if fallback else default_return_val
     
     try:
-        return response.json() if mapper is None else mapper(response.json())
+        if not cassettes.replaying:
+            data = response.json()
+            if cassettes.recording:
+                cassettes.record(service, key, data)
+        if not endpoint is None:
+            governor.spend(endpoint, data)
+        result = data if mapper is None else mapper(data)
     except (KeyError, TypeError, ValueError) as e:
         print(str(e))
         return default_return_val
+
+    if fallback:
+        breakers.remember(key, result)
+    return result
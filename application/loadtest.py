@@ -0,0 +1,211 @@
+""" End to end load generator """
+import json
+import random
+import re
+import statistics
+import time
+
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from threading import Thread, Lock
+from types import SimpleNamespace
+from urllib.parse import urljoin
+
+import requests
+
+from .internal.otps import OTPs
+from .manager import PortfolioManager
+from .seeds import Seeder
+
+_CSRF = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+_HOLDING = re.compile(r'<option selected value="(\d+)">')
+_SHARES = re.compile(r'id="holding" name="holding"[^>]*value="(\d+)"')
+
+class _StepFailed(Exception):
+    pass
+
+class _Recorder:
+    """ Thread safe per step latencies and errors """
+    def __init__(self):
+        self.lock = Lock()
+        self.times = {}
+        self.errors = {}
+
+    def add(self, step, seconds, ok):
+        with self.lock:
+            self.times.setdefault(step, []).append(seconds)
+            if not ok:
+                self.errors[step] = self.errors.get(step, 0) + 1
+
+class _VirtualUser:
+    """ A user driving a flow with its own (cookie) session """
+    def __init__(self, generator, n):
+        self.generator = generator
+        self.recorder = generator.recorder
+        self.url = generator.url
+        self.username = Seeder.username(n)
+        self.email = Seeder.email(n)
+        self.session = requests.Session()
+        self.random = random.Random(n)
+        self.tokens = {}
+
+    def request(self, step, method, path, expect=(200,), **kwargs):
+        """ Times the request as the step, raising _StepFailed if the status isn't expected """
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, urljoin(self.url, path), allow_redirects=False,
+                timeout=self.generator.timeout, **kwargs)
+            ok = response.status_code in expect
+        except requests.RequestException:
+            response = None
+            ok = False
+        self.recorder.add(step, time.perf_counter() - start, ok)
+        if not ok:
+            raise _StepFailed(step)
+        return response
+
+    @staticmethod
+    def csrf(response):
+        match = _CSRF.search(response.text)
+        if match is None:
+            raise _StepFailed("csrf")
+        return match.group(1)
+
+    def symbol(self):
+        return self.random.choice(PortfolioManager.suggestions)
+
+    def __otp(self, login_date):
+        """ The OTP is stubbed, the code is derived the same way the app does from the login
+            time (the Date of the login response) rather than read from the mail sent """
+        verify_url = self.request("send_otp", "GET", "/send-otp?method=mail", expect=(302,)).headers["Location"]
+        csrf = self.csrf(self.request("verify_otp_form", "GET", verify_url))
+
+        # The login time is a naive utc date time
+        login_dt_tm = parsedate_to_datetime(login_date).replace(tzinfo=None)
+        user = SimpleNamespace(email=self.email)
+        for seconds in (0, -1):
+            code = self.generator.otp.generate(user, datetime.fromtimestamp(login_dt_tm.timestamp() + seconds))
+            verified = self.request("verify_otp", "POST", verify_url, expect=(200, 302),
+                data={"csrf_token": csrf, "otp": code})
+            if verified.status_code == 302:
+                return
+        raise _StepFailed("verify_otp")
+
+    def web_login(self):
+        csrf = self.csrf(self.request("login_form", "GET", "/login"))
+        response = self.request("login", "POST", "/login", expect=(302,),
+            data={"csrf_token": csrf, "username": self.username, "password": Seeder.PASSWORD})
+        if "send-otp" in response.headers["Location"]:
+            self.__otp(response.headers["Date"])
+
+    def web(self):
+        self.request("index", "GET", "/")
+        symbol = self.symbol()
+        self.request("quote", "GET", f"/quote?symbol={symbol}")
+
+        csrf = self.csrf(self.request("buy_form", "GET", f"/buy?symbol={symbol}"))
+        self.request("buy", "POST", "/buy", expect=(200, 302), data={"csrf_token": csrf, "symbol": symbol, "shares": 1})
+
+        form = self.request("sell_form", "GET", "/sell")
+        holding = _HOLDING.search(form.text)
+        shares = _SHARES.search(form.text)
+        if holding and shares:
+            self.request("sell", "POST", "/sell", expect=(200, 302), data={"csrf_token": self.csrf(form),
+                "symbol": holding.group(1), "holding": shares.group(1), "shares": 1})
+        self.request("history", "GET", "/history")
+
+    def api_login(self):
+        self.tokens = self.request("token", "POST", "/token",
+            json={"username": self.username, "password": Seeder.PASSWORD}).json()
+
+    def api(self):
+        access = {"Authorization": f"Bearer {self.tokens['access_token']}"}
+        self.request("holdings", "GET", "/portfolio/holdings", headers=access)
+        self.request("price", "GET", f"/market/price?symbol={self.symbol()}", headers=access)
+        refreshed = self.request("refresh", "POST", "/token/refresh",
+            headers={"Authorization": f"Bearer {self.tokens['refresh_token']}"})
+        self.tokens["access_token"] = refreshed.json()["access_token"]
+
+    def run(self, flow, until):
+        login, iteration = (self.web_login, self.web) if flow == "web" else (self.api_login, self.api)
+        logged_in = False
+        while time.perf_counter() < until:
+            try:
+                if not logged_in:
+                    self.session.cookies.clear()
+                    login()
+                    logged_in = True
+                iteration()
+            except _StepFailed:
+                # Start over (logging in again) as the failure may have been the session
+                logged_in = False
+            if self.generator.think:
+                time.sleep(self.random.expovariate(1 / self.generator.think))
+
+class LoadGenerator:
+    """ Drives concurrent virtual (seeded) users through the web flow (login, portfolio,
+        quote, buy, sell, history) or api flow (token, holdings, price, refresh) against a
+        running server, reporting the throughput and latency percentiles per step """
+
+    FLOWS = ["web", "api"]
+
+    def __init__(self, url, users=10, duration=60, flow="web", think=0.0, timeout=30):
+        if not flow in self.FLOWS:
+            raise ValueError(f"Unknown flow {flow}, expected one of {', '.join(self.FLOWS)}")
+        self.url = url
+        self.users = users
+        self.duration = duration
+        self.flow = flow
+        self.think = think
+        self.timeout = timeout
+        self.recorder = _Recorder()
+        self.otp = OTPs()
+
+    @staticmethod
+    def __percentile(times, percent):
+        return times[min(len(times) - 1, int(len(times) * percent))] * 1000
+
+    def __summary(self, times, errors, seconds):
+        times = sorted(times)
+        return {
+            "requests": len(times),
+            "errors": errors,
+            "rps": len(times) / seconds,
+            "mean_ms": statistics.mean(times) * 1000,
+            "p50_ms": self.__percentile(times, 0.50),
+            "p90_ms": self.__percentile(times, 0.90),
+            "p95_ms": self.__percentile(times, 0.95),
+            "p99_ms": self.__percentile(times, 0.99),
+            "max_ms": times[-1] * 1000
+        }
+
+    def run(self):
+        start = time.perf_counter()
+        until = start + self.duration
+        threads = [Thread(target=_VirtualUser(self, n).run, args=(self.flow, until), name=f"vu-{n}", daemon=True)
+            for n in range(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+        times = self.recorder.times
+        errors = self.recorder.errors
+        total = sum(len(step_times) for step_times in times.values())
+        return {
+            "url": self.url,
+            "flow": self.flow,
+            "time": datetime.utcnow().isoformat(),
+            "users": self.users,
+            "seconds": seconds,
+            "requests": total,
+            "errors": sum(errors.values()),
+            "rps": total / seconds,
+            "steps": {step: self.__summary(step_times, errors.get(step, 0), seconds) for step, step_times in times.items()}
+        }
+
+    @staticmethod
+    def write(results, path):
+        with open(path, "w") as out:
+            json.dump(results, out, indent=1)
@@ -1,14 +1,21 @@
 """ Application managers """
-from flask import session
-from flask_jwt_extended import get_jwt_identity
+import time
+
+from flask import current_app, request, session
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request_optional
+from sqlalchemy.orm import selectinload
 
 from .internal.stocks import Stocks
 from .internal.dates import Dates
 from .internal.tokens import URLTokenExpired
-from .internal.emails import VerifyMail, OTPMail, UsernameMail, PasswordResetMail, UnrecognizedAccessMail
-from .internal.sms import OTPSMS
-
-from .models import Users, Holdings, Balances, TwoFactorAuth, Transacted, ClosedPositions, UserLocations
+from .internal.emails import Mail, VerifyMail, OTPMail, UsernameMail, PasswordResetMail, UnrecognizedAccessMail
+from .internal.sms import SMS, OTPSMS
+from .internal.metrics import metrics
+from .internal.passwords import Passwords
+from .internal.serializers import Columns
+
+from .models import Users, Holdings, Balances, TwoFactorAuth, Transacted, ClosedPositions, UserLocations, QueuedOrders, \
+    Notifications
 from . import db, stock, mail, token, otp, sms, geo
 
 class UserContext:
@@ -29,11 +36,32 @@ class UserContext:
         return session["user_id"]
 
     @classmethod
-    def user(cls):
-        return Users.query.filter_by(id=cls.id()).one()
+    def is_admin(cls, jwt_only=False):
+        """ Whether the user in context (session or JWT, only the JWT when jwt_only) is the admin """
+        if jwt_only or session.get("user_id") is None:
+            try:
+                verify_jwt_in_request_optional()
+            except Exception:
+                return False
+
+        try:
+            user_id = get_jwt_identity() if jwt_only else cls.id()
+        except cls.UserNotInContext:
+            return False
+        if user_id is None:
+            return False
+        return Users.query.with_entities(Users.username).filter_by(id=user_id).scalar() == Registrar.ADMIN
+
+    @classmethod
+    def user(cls, *options):
+        """ The user in context along with any relationships the loader options specify """
+        return Users.query.options(*options).filter_by(id=cls.id()).one()
 
 class Registrar:
     """ User Registrar """
+
+    # The username of the admin account
+    ADMIN = "finadmin"
     
     class BadVerification(Exception):
         """ Indicates a bad verification occurred """
@@ -47,6 +75,10 @@ class Registrar:
         """ Indicates a user is already registered """
         pass
 
+    class Busy(Exception):
+        """ Indicates too many passwords are being hashed, the client should retry shortly """
+        pass
+
     @classmethod
     def register(cls, username, first, last, email, password, verified=False, 
         twofa_enabled=True, send_email=True):
@@ -55,23 +87,27 @@ class Registrar:
             raise cls.UserAlreadyRegistered()
         elif not cls.query_by_email(email) is None:
             raise cls.UserAlreadyRegistered()
-        user = Users(username, first, last, email, password, verified)
+        try:
+            user = Users(username, first, last, email, password, verified)
+        except Passwords.Busy:
+            raise cls.Busy()
         db.session.add(user)
     
         user = Users.query.filter_by(username=username).one()
         auth = TwoFactorAuth(user.id, twofa_enabled)
         db.session.add(auth)
+        if send_email and not user.verified:
+            Outbox.mail(VerifyMail(user.email, token.generate(user.email)))
 
         db.session.commit()
-        if send_email:
-            cls.request_verification(user)
 
     @classmethod
     def request_verification(cls, user=None):
         """ Sends the verification email for the new user """
         user = user or UserContext.user()
         if not user.verified:
-            mail.send(VerifyMail(user.email, token.generate(user.email)))
+            Outbox.mail(VerifyMail(user.email, token.generate(user.email)))
+            db.session.commit()
             return True
         return False
 
@@ -98,15 +134,17 @@ class Registrar:
         Transacted.query.filter_by(user_id=id).delete()
         ClosedPositions.query.filter_by(user_id=id).delete()
         Holdings.query.filter_by(user_id=id).delete()
+        QueuedOrders.query.filter_by(user_id=id).delete()
         UserLocations.query.filter_by(user_id=id).delete()
         TwoFactorAuth.query.filter_by(user_id=id).delete()
         Users.query.filter_by(id=id).delete()
         db.session.commit()
 
     @staticmethod
-    def all():
-        """ All of the users registered in the system """
-        return Users.query.all()
+    def all(*options):
+        """ All of the users registered in the system along with any relationships the
+            loader options specify """
+        return Users.query.options(*options).all()
 
     @staticmethod
     def query_by_username(username):
@@ -127,6 +165,10 @@ class BasicAuth:
         """ Indicates the account has been locked """
         pass
 
+    class Busy(Exception):
+        """ Indicates too many logins are being verified, the client should retry shortly """
+        pass
+
     @classmethod
     def authenticate(cls, username, password):
         user = Registrar.query_by_username(username)
@@ -134,11 +176,25 @@ class BasicAuth:
             raise cls.BadCredentials()
         elif user.locked:
             raise cls.AccountLocked()
-        elif not user.verify_password(password):
+
+        try:
+            verified = user.verify_password(password)
+        except Passwords.Busy:
+            raise cls.Busy()
+        if not verified:
             if AccountManager.lock(user):
                 raise cls.AccountLocked()
             raise cls.BadCredentials()
 
+        if user.needs_rehash:
+            # Upgrades (or downgrades) the hash to the configured parameters, when busy
+            # it's left for the next login
+            try:
+                user.password = password
+                db.session.commit()
+            except Passwords.Busy:
+                pass
+
         LocationManager.check_location(user)
         return user
 
@@ -148,18 +204,29 @@ class LocationManager:
     @staticmethod
     def check_location(user):
         """ Checks the location of the client against the location of the user when the account
-            was initially logged into to see if the location has changed """
-        details = geo.location()
-        if details is None:
-            return
-        
-        user_loc = UserLocations.query.filter_by(user_id=user.id).first() 
-        if user_loc is None:
-            loc = UserLocations(user.id, details)
-            db.session.add(loc)
-            db.session.commit()
-        elif user_loc.loc != details["loc"]:
-            mail.send(UnrecognizedAccessMail(user.email, details, token.generate(user.username)))
+            was initially logged into to see if the location has changed. The check runs in 
+            the background so the login doesn't wait on the lookup """
+        geo.submit(LocationManager.__check_location, current_app._get_current_object(), request.host_url,
+            geo.remote_addr(), user.id, user.email, user.username)
+
+    @staticmethod
+    def __check_location(app, host_url, remote_addr, user_id, email, username):
+        try:
+            with app.test_request_context(base_url=host_url):
+                details = geo.lookup(remote_addr)
+                if details is None:
+                    return
+
+                user_loc = UserLocations.query.filter_by(user_id=user_id).first() 
+                if user_loc is None:
+                    loc = UserLocations(user_id, details)
+                    db.session.add(loc)
+                    db.session.commit()
+                elif user_loc.loc != details["loc"]:
+                    Outbox.mail(UnrecognizedAccessMail(email, details, token.generate(username)))
+                    db.session.commit()
+        except Exception as e:
+            print(str(e))
 
 class TwoFactAuth:
     """ Two Factor Authentication """
@@ -194,9 +261,10 @@ class TwoFactAuth:
         cls.__check_method(method)
         code = otp.generate(user, session["login_dt_tm"])
         if method == "sms":
-            sms.send(OTPSMS(to, code))
+            Outbox.sms(OTPSMS(to, code))
         else:
-            mail.send(OTPMail(to, code))
+            Outbox.mail(OTPMail(to, code))
+        db.session.commit()
         return token.generate(to)
 
     @classmethod
@@ -206,9 +274,10 @@ class TwoFactAuth:
         code = otp.generate(UserContext.user(), session["login_dt_tm"])
         to = token.val(dest)
         if method == "sms":
-            sms.send(OTPSMS(to, code))
+            Outbox.sms(OTPSMS(to, code))
         else:
-            mail.send(OTPMail(to, code))
+            Outbox.mail(OTPMail(to, code))
+        db.session.commit()
 
 class PortfolioManager:
     """ User Portfolio Manager """
@@ -315,6 +384,19 @@ class PortfolioManager:
         'ZM',
         'ZNGA']
 
+    # Columns of the holdings returned by the JSON API
+    holding_columns = Columns(Holdings)
+
+    # Fields of the positions returned by the JSON API. The quoted ones need the stock's quote,
+    # the priced ones its latest price, the others don't look anything up
+    POSITION_FIELDS = ("name", "symbol", "shares", "pps", "ppsChange", "price", "dayChange", "cost", "value", "change")
+    QUOTED_FIELDS = frozenset(("name", "dayChange"))
+    PRICED_FIELDS = frozenset(("price", "ppsChange", "value", "change"))
+
+    # Fields and columns of the closed positions returned by the JSON API
+    CLOSED_POSITION_FIELDS = ("symbol", "shares", "pps", "price", "date", "cost", "value", "change")
+    closed_position_columns = Columns(ClosedPositions, ("id", "symbol", "shares", "pps", "price", "close_dt_tm"))
+
     @classmethod
     def portfolio(cls):
         """ The user's portfolio """
@@ -325,7 +407,9 @@ class PortfolioManager:
 
         append = positions.append
         lookup = stock.lookup
-        for holding in cls.query_holdings_by_user():
+        holdings = cls.query_holdings_by_user().all()
+        stock.prefetch([holding.symbol for holding in holdings])
+        for holding in holdings:
             ticker = lookup(holding.symbol)
 
             cost = Stocks.valuation(holding.price, holding.shares)
@@ -380,7 +464,9 @@ class PortfolioManager:
         values_append = values.append
         latest_price = stock.latest_price
 
-        for holding in cls.query_holdings_by_user():
+        holdings = cls.query_holdings_by_user().all()
+        stock.prefetch([holding.symbol for holding in holdings])
+        for holding in holdings:
             values_append(Stocks.valuation(latest_price(holding.symbol), holding.shares))
             labels_append(holding.symbol) 
 
@@ -454,6 +540,100 @@ class PortfolioManager:
             "change": value - cost
         }
 
+    @classmethod
+    def __tickers(cls, symbols, fields):
+        """ The quotes (only the latest prices when the fields don't need more) of the stocks
+            looked up in batch calls, nothing's looked up when the fields don't need them """
+        if cls.QUOTED_FIELDS.intersection(fields):
+            return stock.quotes(symbols)
+        if cls.PRICED_FIELDS.intersection(fields):
+            return {symbol: None if price is None else {"price": price} for symbol, price in stock.latest_prices(symbols).items()}
+        return {}
+
+    @staticmethod
+    def __valuate(holding, ticker):
+        """ The holding's position, the fields depending on the ticker are None without one """
+        ticker = ticker or {}
+        price = ticker.get("price")
+        cost = Stocks.valuation(holding.price, holding.shares)
+        value = None if price is None else Stocks.valuation(price, holding.shares)
+
+        return {
+            "name": ticker.get("name"),
+            "symbol": holding.symbol,
+            "shares": holding.shares,
+            "pps": holding.price,
+            "ppsChange": None if price is None else price - holding.price,
+            "price": price,
+            "dayChange": ticker.get("change"),
+            "cost": cost,
+            "value" : value,
+            "change": None if value is None else value - cost
+        }
+
+    @classmethod
+    def __positions(cls, fields, symbol=None):
+        query = cls.query_holdings_by_user()
+        if not symbol is None:
+            query = query.filter_by(symbol=symbol.upper())
+        holdings = query.all()
+
+        tickers = cls.__tickers([holding.symbol for holding in holdings], fields)
+        return [cls.__valuate(holding, tickers.get(holding.symbol)) for holding in holdings]
+
+    @classmethod
+    def positions(cls, fields, symbol=None):
+        """ The user's positions (only the one for the symbol when specified) limited to the fields """
+        return [{field: position[field] for field in fields} for position in cls.__positions(fields, symbol)]
+
+    @classmethod
+    def summary(cls, fields):
+        """ The user's portfolio summary with the positions limited to the fields. The cost and value
+            include the cash on hand, the value and change are only totaled when the fields look up
+            the positions' prices (None when any of them couldn't be priced) """
+        positions = cls.__positions(fields)
+        cash = cls.cash_on_hand()
+        summary = {
+            "positions": [{field: position[field] for field in fields} for position in positions],
+            "cash": cash,
+            "cost": sum(position["cost"] for position in positions) + cash
+        }
+
+        if cls.PRICED_FIELDS.intersection(fields) or cls.QUOTED_FIELDS.intersection(fields):
+            values = [position["value"] for position in positions]
+            priced = not None in values
+            summary["value"] = sum(values) + cash if priced else None
+            summary["change"] = sum(position["change"] for position in positions) if priced else None
+        return summary
+
+    @classmethod
+    def closed_positions_page(cls, fields, limit, after=None):
+        """ A page of the user's closed positions (latest first) limited to the fields, continuing
+            after the id of the previous page's last position. Returns the positions along with the
+            id the next page continues after (None on the last page) """
+        query = ClosedPositions.query.filter_by(user_id=UserContext.id())
+        if not after is None:
+            query = query.filter(ClosedPositions.id < after)
+        rows = cls.closed_position_columns.rows(query.order_by(ClosedPositions.id.desc()).limit(limit + 1))
+
+        positions = []
+        append = positions.append
+        for row in rows[:limit]:
+            cost = Stocks.valuation(row["pps"], row["shares"])
+            value = Stocks.valuation(row["price"], row["shares"])
+            position = {
+                "symbol": row["symbol"],
+                "shares": row["shares"],
+                "pps": row["pps"],
+                "price": row["price"],
+                "date": row["close_dt_tm"],
+                "cost": cost,
+                "value" : value,
+                "change": value - cost
+            }
+            append({field: position[field] for field in fields})
+        return positions, rows[limit - 1]["id"] if len(rows) > limit else None
+
     @staticmethod
     def history(page):
         """ The user's transaction history """
@@ -482,6 +662,15 @@ class PortfolioManager:
         """ The asking price for the stock """
         return stock.latest_price(symbol.upper())
 
+    @staticmethod
+    def asking_prices(symbols):
+        """ The quotes for the (upper case) stocks in chunks of the IEX batch size, so large
+            requests can be answered as they're looked up. Yields the chunk's symbols along
+            with their quotes (None when unknown, missing when it couldn't be looked up) """
+        for i in range(0, len(symbols), Stocks.BATCH_LIMIT):
+            chunk = symbols[i:i + Stocks.BATCH_LIMIT]
+            yield chunk, stock.quotes(chunk)
+
     @staticmethod
     def query_holdings_by_user(user_id=None):
         return Holdings.query.filter_by(user_id=user_id or UserContext.id()).order_by(Holdings.symbol)
@@ -489,11 +678,7 @@ class PortfolioManager:
     @classmethod
     def holdings(cls):
         """ The user's holdings """
-        holdings = []
-        append = holdings.append
-        for holding in cls.query_holdings_by_user():
-            append(holding.asdict())
-        return holdings
+        return cls.holding_columns.rows(cls.query_holdings_by_user())
 
     @classmethod
     def holding(cls, holding_id):
@@ -502,11 +687,16 @@ class PortfolioManager:
         if holding is None:
             return None
 
-        response = holding.asdict()
+        response = cls.holding_columns(holding)
         response["pps"] = response["price"]
         response["price"] = cls.asking_price(holding.symbol)
         return response
 
+    @staticmethod
+    def holdings_version():
+        """ The version of the user's holdings, changes whenever they do """
+        return UserContext.id(), Users.query.with_entities(Users.holdings_version).filter_by(id=UserContext.id()).scalar()
+
     @classmethod
     def holding_symbols(cls):
         symbols = []
@@ -577,11 +767,249 @@ class PortfolioManager:
         user.cash += cost
         db.session.commit()
 
+    @staticmethod
+    def queue_buy(symbol, shares):
+        """ Queues a purchase to be settled when the market opens. The cash on hand is checked
+            against the asking price (not queued when the symbol can't be priced), the order is
+            checked again against the opening price """
+        symbol = symbol.upper()
+        price = stock.latest_price(symbol)
+        if price is None:
+            return False
+
+        user = UserContext.user()
+        if user.cash < Stocks.valuation(price, shares):
+            return False
+        OrderQueue.enqueue(user.id, "BUY", symbol, shares)
+        return True
+
+    @staticmethod
+    def queue_sell(holding, shares):
+        """ Queues a sale to be settled when the market opens """
+        OrderQueue.enqueue(holding.user_id, "SELL", holding.symbol, shares)
+
     @staticmethod
     def is_market_closed():
         """ Whether the market is open """
         return not Stocks.is_exchange_open()
 
+class OrderQueue:
+    """ Market on open order queue. Orders placed while the market is closed are
+        queued and settled in a single batch once the market opens """
+
+    @staticmethod
+    def enqueue(user_id, type, symbol, shares):
+        """ Queues the order """
+        order = QueuedOrders(user_id=user_id, type=type, symbol=symbol, shares=shares,
+            status=QueuedOrders.QUEUED, queue_dt_tm=Dates.now_utc_str())
+        db.session.add(order)
+        db.session.commit()
+
+    @staticmethod
+    def pending_symbols():
+        """ The distinct symbols of the orders waiting to be settled """
+        return sorted(symbol for symbol, in db.session.query(QueuedOrders.symbol)
+            .filter_by(status=QueuedOrders.QUEUED).distinct())
+
+    @staticmethod
+    def claim(symbols, limit):
+        """ Claims the oldest orders waiting to be settled for the symbols, locked until the
+            transaction ends so concurrent settlements skip them rather than filling them twice """
+        return db.session.query(QueuedOrders.id, QueuedOrders.user_id, QueuedOrders.type, QueuedOrders.symbol,
+            QueuedOrders.shares).filter(QueuedOrders.status == QueuedOrders.QUEUED, QueuedOrders.symbol.in_(symbols))\
+            .order_by(QueuedOrders.id).limit(limit).with_for_update(skip_locked=True).all()
+
+    @classmethod
+    def settle(cls, chunk_size=500):
+        """ Settles the queued orders at the current (opening) price. Prices are fetched once 
+            for the distinct symbols and the orders are claimed and settled in chunks, each chunk
+            being committed along with the status of its orders so re-running (or a concurrent
+            run) only picks up the orders which haven't been settled yet. Orders whose price
+            couldn't be fetched (IEX failing) are left queued for the next run, only unknown
+            symbols are rejected """
+        start = time.perf_counter()
+        symbols = cls.pending_symbols()
+        prices = stock.opening_prices(symbols) if symbols else {}
+        db.session.commit()
+
+        filled = 0
+        rejected = 0
+        priced = sorted(prices)
+        while priced:
+            orders = cls.claim(priced, chunk_size)
+            if not orders:
+                break
+            chunk_filled = cls.__settle_chunk(orders, prices)
+            filled += chunk_filled
+            rejected += len(orders) - chunk_filled
+
+        deferred = QueuedOrders.query.filter(QueuedOrders.status == QueuedOrders.QUEUED,
+            ~QueuedOrders.symbol.in_(priced)).count() if symbols else 0
+        return {
+            "filled": filled,
+            "rejected": rejected,
+            "deferred": deferred,
+            "seconds": time.perf_counter() - start
+        }
+
+    @staticmethod
+    def __settle_chunk(orders, prices):
+        """ Settles a chunk of (claimed) orders in a single transaction, the users and their
+            holdings are locked as concurrent chunks may settle orders of the same users """
+        user_ids = {order.user_id for order in orders}
+        users = {user.id: user for user in Users.query.filter(Users.id.in_(user_ids)).order_by(Users.id).with_for_update()}
+        holdings = {(holding.user_id, holding.symbol): holding 
+            for holding in Holdings.query.filter(Holdings.user_id.in_(user_ids)).order_by(Holdings.id).with_for_update()}
+
+        fill_dt_tm = Dates.now_utc_str()
+        statuses = []
+        transactions = []
+        closed_positions = []
+
+        filled = 0
+        for order in orders:
+            ticker = prices[order.symbol]
+            user = users[order.user_id]
+            key = (order.user_id, order.symbol)
+            holding = holdings.get(key)
+            status = QueuedOrders.REJECTED
+            price = None
+
+            if not ticker is None:
+                price = ticker["price"]
+                cost = Stocks.valuation(price, order.shares)
+                
+                if order.type == "BUY" and user.cash >= cost:
+                    user.cash -= cost
+                    if holding is None:
+                        holdings[key] = Holdings(user_id=order.user_id, symbol=order.symbol, shares=order.shares, price=price)
+                        db.session.add(holdings[key])
+                    else:
+                        holding_shares = holding.shares + order.shares
+                        holding.price = round((Stocks.valuation(holding.shares, holding.price) + cost) / holding_shares, 2)
+                        holding.shares = holding_shares
+                    status = QueuedOrders.FILLED
+                elif order.type == "SELL" and not holding is None and holding.shares >= order.shares:
+                    holding_shares = holding.shares - order.shares
+                    if holding_shares > 0:
+                        holding.shares = holding_shares
+                    else:
+                        db.session.delete(holdings.pop(key))
+                    user.cash += cost
+                    closed_positions.append({"user_id": order.user_id, "symbol": order.symbol, "shares": order.shares,
+                        "pps": holding.price, "price": price, "close_dt_tm": fill_dt_tm})
+                    status = QueuedOrders.FILLED
+
+                if status == QueuedOrders.FILLED:
+                    transactions.append({"user_id": order.user_id, "type": order.type, "name": ticker["name"], 
+                        "symbol": order.symbol, "shares": order.shares, "price": price, "cost": cost, "trans_dt_tm": fill_dt_tm})
+                    filled += 1
+
+            statuses.append({"id": order.id, "status": status, "price": price, "fill_dt_tm": fill_dt_tm})
+
+        db.session.bulk_insert_mappings(Transacted, transactions)
+        db.session.bulk_insert_mappings(ClosedPositions, closed_positions)
+        db.session.bulk_update_mappings(QueuedOrders, statuses)
+        db.session.commit()
+        return filled
+
+class Outbox:
+    """ Transactional notification outbox. Notifications are added to the session (so they're
+        committed along with the changes of the request) and delivered in batches by the
+        drain_outbox worker, failures are retried with an exponential backoff until they're
+        dead lettered. The bodies (OTP codes, reset links) are cleared once sent, sent and dead
+        notifications are purged after the retention period. When the outbox is disabled
+        notifications are sent directly """
+
+    # Seconds before the first retry, doubled every attempt up to the max
+    BACKOFF = 30
+    MAX_BACKOFF = 3600
+
+    @staticmethod
+    def __add(channel, recipient, subject, body):
+        db.session.add(Notifications(channel=channel, recipient=recipient, subject=subject, body=body,
+            status=Notifications.PENDING, attempts=0, next_attempt=0, queue_dt_tm=Dates.now_utc_str()))
+
+    @classmethod
+    def mail(cls, message):
+        if current_app.config["OUTBOX_ENABLED"]:
+            cls.__add(Notifications.MAIL, message.email_to, message.subject, message.html)
+        else:
+            mail.send(message)
+
+    @classmethod
+    def sms(cls, message):
+        if current_app.config["OUTBOX_ENABLED"]:
+            cls.__add(Notifications.SMS, message.to, None, message.message)
+        else:
+            sms.send(message)
+
+    @classmethod
+    def __backoff(cls, attempts):
+        return min(cls.MAX_BACKOFF, cls.BACKOFF * 2 ** (attempts - 1))
+
+    @classmethod
+    def drain(cls, batch_size=100):
+        """ Delivers a batch of the due notifications (locked so concurrent workers skip them),
+            returns the number sent, retried and dead lettered """
+        now = int(time.time())
+        batch = Notifications.query.filter(Notifications.status == Notifications.PENDING, 
+            Notifications.next_attempt <= now).order_by(Notifications.id).limit(batch_size)\
+            .with_for_update(skip_locked=True).all()
+        mails = [notification for notification in batch if notification.channel == Notifications.MAIL]
+        texts = [notification for notification in batch if notification.channel == Notifications.SMS]
+
+        errors = mail.send_batch([Mail(n.recipient, n.subject, n.body) for n in mails]) if mails else []
+        errors += sms.send_batch([SMS(n.recipient, n.body) for n in texts]) if texts else []
+
+        report = {"sent": 0, "retried": 0, "dead": 0}
+        max_attempts = current_app.config["OUTBOX_MAX_ATTEMPTS"]
+        sent_dt_tm = Dates.now_utc_str()
+        for notification, error in zip(mails + texts, errors):
+            notification.attempts += 1
+            if error is None:
+                notification.status = Notifications.SENT
+                notification.sent_dt_tm = sent_dt_tm
+                notification.body = ""
+                report["sent"] += 1
+                continue
+
+            notification.last_error = str(error)[:255]
+            if notification.attempts >= max_attempts:
+                notification.status = Notifications.DEAD
+                report["dead"] += 1
+            else:
+                notification.next_attempt = now + cls.__backoff(notification.attempts)
+                report["retried"] += 1
+        db.session.commit()
+        return report
+
+    @staticmethod
+    def purge():
+        """ Deletes the sent and dead notifications queued before the retention period,
+            returns the number deleted """
+        days = current_app.config["OUTBOX_RETENTION_DAYS"]
+        if days <= 0:
+            return 0
+        purged = Notifications.query.filter(Notifications.status.in_((Notifications.SENT, Notifications.DEAD)),
+            Notifications.queue_dt_tm < Dates.days_ago_utc_str(days)).delete(synchronize_session=False)
+        db.session.commit()
+        return purged
+
+    @staticmethod
+    def depth():
+        """ The number of notifications by status """
+        return dict(db.session.query(Notifications.status, db.func.count(Notifications.id))
+            .group_by(Notifications.status).all())
+
+_outbox = metrics.gauge("outbox_notifications", "Notifications in the outbox by status", ("status",))
+
+@metrics.collector
+def _collect_outbox():
+    if current_app.config["OUTBOX_ENABLED"]:
+        for status, count in Outbox.depth().items():
+            _outbox.set(count, status)
+
 class AccountManager:
     """ User Account Manager """
     
@@ -597,6 +1025,10 @@ class AccountManager:
         """ Indicates an attempt to use an email that already exists in the system """
         pass
 
+    class Busy(Exception):
+        """ Indicates too many passwords are being verified, the user should retry shortly """
+        pass
+
     @staticmethod
     def lock(user, max_allow=4):
         if not user.locked:
@@ -638,7 +1070,8 @@ class AccountManager:
             are in the system """
         user = Registrar.query_by_email(email)
         if not user is None:
-            mail.send(UsernameMail(user.email, user.username))
+            Outbox.mail(UsernameMail(user.email, user.username))
+            db.session.commit()
             return True
         return False
 
@@ -647,7 +1080,8 @@ class AccountManager:
         """ Sends a password reset link granted they are in the system """
         user = Registrar.query_by_username(username)
         if not user is None:
-            mail.send(PasswordResetMail(user.email, token.generate(user.username)))
+            Outbox.mail(PasswordResetMail(user.email, token.generate(user.username)))
+            db.session.commit()
             return True
         return False
 
@@ -677,6 +1111,8 @@ class AccountManager:
             return False
         except URLTokenExpired:
             raise AccountManager.ResetPasswordExpired()
+        except Passwords.Busy:
+            raise AccountManager.Busy()
 
     @staticmethod
     def deposit(amount):
@@ -692,7 +1128,9 @@ class AccountManager:
     @classmethod
     def update_balances(cls):
         """ Updates the user account balances at the end of the day """
-        for user in Registrar.all():
+        users = Registrar.all(selectinload(Users.holdings))
+        stock.prefetch([holding.symbol for user in users for holding in user.holdings])
+        for user in users:
             balance = Balances(user_id=user.id, value=cls.account_balance(user), 
                 bal_dt_tm=Dates.now_utc_str())
             db.session.add(balance)
@@ -701,11 +1139,11 @@ class AccountManager:
     @staticmethod
     def account_balance(user):
         """ Updates the user's account balance accounting for any stock splits that 
-            might have occured """
+            might have occured. The user's holdings must have been loaded """
         value = user.cash
 
         latest_price = stock.latest_price
-        for holding in PortfolioManager.query_holdings_by_user(user.id):
+        for holding in user.holdings:
             price = latest_price(holding.symbol)
             
             split = Stocks.is_split(holding.price, price, holding.shares)
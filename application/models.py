@@ -1,10 +1,9 @@
 """Data models."""
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy.orm import relationship
+from sqlalchemy import event
 
 from .internal.dates import Dates
 
-from . import db
+from . import db, passwords
 
 class Users(db.Model):
 	"""Data model for user accounts."""
@@ -21,12 +20,16 @@ class Users(db.Model):
 	verify_ind = db.Column(db.SmallInteger, nullable=False, default=0)
 	verify_dt_tm = db.Column(db.Text, index=False, unique=False, nullable=True)
 	locked_ind = db.Column(db.SmallInteger, nullable=False, default=0)
-	balances = relationship("Balances")
-	holdings = relationship("Holdings")
-	closed_positions = relationship("ClosedPositions")
-	history = relationship("Transacted")
-	twofa = relationship("TwoFactorAuth")
-	locs = relationship("UserLocations")
+	# Incremented whenever the user's holdings change (the ETag of the holdings APIs)
+	holdings_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+	# Relationships are never lazy loaded. Paths which need them load them explicitly 
+	# (selectinload / joinedload), the unbounded ones are queried (and paginated) instead
+	balances = db.relationship("Balances", lazy="dynamic")
+	holdings = db.relationship("Holdings", lazy="raise", order_by="Holdings.symbol")
+	closed_positions = db.relationship("ClosedPositions", lazy="raise")
+	history = db.relationship("Transacted", lazy="dynamic")
+	twofa = db.relationship("TwoFactorAuth", lazy="raise")
+	locs = db.relationship("UserLocations", lazy="raise")
 
 	def __init__(self, username, first, last, email, password, verified):
 		self.username = username.lower()
@@ -60,10 +63,14 @@ class Users(db.Model):
 
 	@password.setter
 	def password(self, password):
-		self.hash = generate_password_hash(password)
+		self.hash = passwords.hash(password)
 
 	def verify_password(self, password):
-		return check_password_hash(self.hash, password)
+		return passwords.verify(self.hash, password)
+
+	@property
+	def needs_rehash(self):
+		return passwords.needs_rehash(self.hash)
 
 	def __repr__(self):
 		return "<User(id='{0}', username='{1}', verified='{2}', locked='{3}', cash='{4}')>".format(
@@ -145,6 +152,15 @@ class Holdings(db.Model):
 		return "<Holding(id='{0}', user_id='{1}', symbol='{2}', shares='{3}', price='{4}')>".format(
 			self.id, self.user_id, self.symbol, self.shares, self.price)
 
+@event.listens_for(Holdings, "after_insert")
+@event.listens_for(Holdings, "after_update")
+@event.listens_for(Holdings, "after_delete")
+def holdings_changed(mapper, connection, target):
+	"""Bumps the user's holdings version within the flush"""
+	users = Users.__table__
+	connection.execute(users.update().where(users.c.id == target.user_id).values(
+		holdings_version=users.c.holdings_version + 1))
+
 class ClosedPositions(db.Model):
 	"""Data model for closed user positions."""
 
@@ -178,3 +194,74 @@ class Transacted(db.Model):
 	def __repr__(self):
 		return "<Transacted(id='{0}', user_id='{1}', type='{2}', symbol='{3}', shares='{4}', price='{5}', cost='{6}', trans_dt_tm='{7}')>".format(
 			self.id, self.user_id, self.type, self.symbol, self.shares, self.price, self.cost, self.trans_dt_tm)
+
+class QueuedOrders(db.Model):
+	"""Data model for orders queued while the market is closed."""
+
+	QUEUED = "QUEUED"
+	FILLED = "FILLED"
+	REJECTED = "REJECTED"
+
+	__tablename__ = 'queued_orders'
+	id = db.Column(db.Integer, index=True, primary_key=True, autoincrement=True)
+	user_id = db.Column(db.ForeignKey('users.id'), index=True, unique=False, nullable=False)
+	type = db.Column(db.String(5), index=False, unique=False, nullable=False)
+	symbol = db.Column(db.String(6), index=False, unique=False, nullable=False)
+	shares = db.Column(db.Integer, index=False, unique=False, nullable=False)
+	status = db.Column(db.String(8), index=True, unique=False, nullable=False, default=QUEUED)
+	price = db.Column(db.Float(precision='12,2'), index=False, unique=False, nullable=True)
+	queue_dt_tm = db.Column(db.Text, index=False, unique=False, nullable=False)
+	fill_dt_tm = db.Column(db.Text, index=False, unique=False, nullable=True)
+
+	def __repr__(self):
+		return "<QueuedOrder(id='{0}', user_id='{1}', type='{2}', symbol='{3}', shares='{4}', status='{5}', price='{6}')>".format(
+			self.id, self.user_id, self.type, self.symbol, self.shares, self.status, self.price)
+
+class Sessions(db.Model):
+	"""Data model for the server side sessions."""
+
+	__tablename__ = 'sessions'
+	id = db.Column(db.String(64), primary_key=True)
+	data = db.Column(db.LargeBinary, index=False, unique=False, nullable=False)
+	expiry = db.Column(db.Integer, index=True, unique=False, nullable=False)
+
+	def __repr__(self):
+		return "<Session(id='{0}', expiry='{1}')>".format(self.id, self.expiry)
+
+class Notifications(db.Model):
+	"""Data model for the notification (mail / sms) outbox."""
+
+	MAIL = "MAIL"
+	SMS = "SMS"
+
+	PENDING = "PENDING"
+	SENT = "SENT"
+	DEAD = "DEAD"
+
+	__tablename__ = 'notifications'
+	__table_args__ = (db.Index('ix_notifications_status_next_attempt', 'status', 'next_attempt'),)
+	id = db.Column(db.Integer, index=True, primary_key=True, autoincrement=True)
+	channel = db.Column(db.String(4), index=False, unique=False, nullable=False)
+	recipient = db.Column(db.String(320), index=False, unique=False, nullable=False)
+	subject = db.Column(db.String(255), index=False, unique=False, nullable=True)
+	body = db.Column(db.Text, index=False, unique=False, nullable=False)
+	status = db.Column(db.String(7), index=False, unique=False, nullable=False, default=PENDING)
+	attempts = db.Column(db.Integer, index=False, unique=False, nullable=False, default=0)
+	next_attempt = db.Column(db.Integer, index=False, unique=False, nullable=False, default=0)
+	last_error = db.Column(db.String(255), index=False, unique=False, nullable=True)
+	queue_dt_tm = db.Column(db.Text, index=False, unique=False, nullable=False)
+	sent_dt_tm = db.Column(db.Text, index=False, unique=False, nullable=True)
+
+	def __repr__(self):
+		return "<Notification(id='{0}', channel='{1}', recipient='{2}', status='{3}', attempts='{4}')>".format(
+			self.id, self.channel, self.recipient, self.status, self.attempts)
+
+class RateLimits(db.Model):
+	"""Data model for the rate limit buckets shared by the workers."""
+
+	__tablename__ = 'rate_limits'
+	bucket = db.Column(db.String(128), primary_key=True)
+	tat = db.Column(db.BigInteger, index=True, unique=False, nullable=False)
+
+	def __repr__(self):
+		return "<RateLimit(bucket='{0}', tat='{1}')>".format(self.bucket, self.tat)
@@ -0,0 +1,129 @@
+""" Synthetic data seeder """
+import random
+
+from datetime import datetime, timedelta
+from dateutil import tz
+
+from .internal.iexstub import reference_price
+from .manager import PortfolioManager
+from .models import Users, Holdings, Balances, TwoFactorAuth, Transacted, ClosedPositions
+from . import db, passwords
+
+class Seeder:
+    """ Bulk seeds users with realistic holdings, transactions, closed positions and
+        balances. Seeded users are named seed-<n> and share the password 'password' """
+
+    PREFIX = "seed-"
+    PASSWORD = "password"
+
+    def __init__(self, seed=1, days=90):
+        self.random = random.Random(seed)
+        self.days = days
+        self.hash = passwords.hash(self.PASSWORD)
+        self.now = datetime.utcnow().replace(tzinfo=tz.gettz('UTC'))
+
+    @classmethod
+    def username(cls, n):
+        return f"{cls.PREFIX}{n:07d}"
+
+    @classmethod
+    def email(cls, n):
+        return f"{cls.username(n)}@fin4dummy.com"
+
+    def __dt_tm(self, days_ago):
+        """ The date time (utc string) the specified number of days ago """
+        dt_tm = self.now - timedelta(days=days_ago, seconds=self.random.randint(0, 86399))
+        return dt_tm.strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+
+    def __price(self, symbol):
+        """ A price for the symbol within 20% of its reference price """
+        return round(reference_price(symbol) * self.random.uniform(0.8, 1.2), 2)
+
+    def __shares(self):
+        """ Share counts are heavily skewed towards small positions """
+        return max(1, int(self.random.lognormvariate(2.5, 1.0)))
+
+    def __users(self, start, count):
+        return [{
+            "username": self.username(n),
+            "first_name": "seed",
+            "last_name": f"user{n}",
+            "email": self.email(n),
+            "hash": self.hash,
+            "cash": round(self.random.uniform(500, 50000), 2),
+            "verify_ind": 1,
+            "verify_dt_tm": self.__dt_tm(self.days),
+            "locked_ind": 0
+        } for n in range(start, start + count)]
+
+    def __user_rows(self, user_id, rows):
+        """ Adds the holdings, transactions, closed positions and balances for the user """
+        rand = self.random
+        symbols = rand.sample(PortfolioManager.suggestions, min(len(PortfolioManager.suggestions),
+            max(1, int(rand.expovariate(1 / 8)))))
+
+        rows["twofa"].append({"user_id": user_id, "auth_flag": 0})
+        for symbol in symbols:
+            shares = 0
+            cost = 0.0
+            for _ in range(rand.randint(1, 5)):
+                bought = self.__shares()
+                price = self.__price(symbol)
+                shares += bought
+                cost += price * bought
+                rows["transacted"].append({"user_id": user_id, "type": "BUY", "name": f"{symbol} Inc.",
+                    "symbol": symbol, "shares": bought, "price": price, "cost": round(price * bought, 2),
+                    "trans_dt_tm": self.__dt_tm(rand.randint(1, self.days))})
+            rows["holdings"].append({"user_id": user_id, "symbol": symbol, "shares": shares,
+                "price": round(cost / shares, 2)})
+
+        for _ in range(int(rand.expovariate(1 / 5))):
+            symbol = rand.choice(PortfolioManager.suggestions)
+            shares = self.__shares()
+            price = self.__price(symbol)
+            close_dt_tm = self.__dt_tm(rand.randint(1, self.days))
+            rows["closed"].append({"user_id": user_id, "symbol": symbol, "shares": shares,
+                "pps": self.__price(symbol), "price": price, "close_dt_tm": close_dt_tm})
+            rows["transacted"].append({"user_id": user_id, "type": "SELL", "name": f"{symbol} Inc.",
+                "symbol": symbol, "shares": shares, "price": price, "cost": round(price * shares, 2),
+                "trans_dt_tm": close_dt_tm})
+
+        for _ in range(rand.randint(0, 3)):
+            amount = rand.choice([1000, 5000, 10000, 20000])
+            rows["transacted"].append({"user_id": user_id, "type": "DEP", "name": "CASH", "symbol": "CASH",
+                "shares": amount, "price": 1, "cost": amount, "trans_dt_tm": self.__dt_tm(rand.randint(1, self.days))})
+
+        value = 10000.0
+        for days_ago in range(self.days, 0, -1):
+            if (self.now - timedelta(days=days_ago)).weekday() < 5:
+                value = round(value * rand.gauss(1.0005, 0.015), 2)
+                rows["balances"].append({"user_id": user_id, "value": value, "bal_dt_tm": self.__dt_tm(days_ago)})
+
+    def seed(self, users, chunk_size=500):
+        """ Seeds the users, committing every chunk. Returns the number of rows inserted """
+        start = Users.query.filter(Users.username.like(f"{self.PREFIX}%")).count()
+        inserted = 0
+        for offset in range(0, users, chunk_size):
+            count = min(chunk_size, users - offset)
+            db.session.bulk_insert_mappings(Users, self.__users(start + offset, count))
+            usernames = [self.username(n) for n in range(start + offset, start + offset + count)]
+            user_ids = [user_id for user_id, in db.session.query(Users.id).filter(Users.username.in_(usernames))]
+
+            rows = {"twofa": [], "holdings": [], "transacted": [], "closed": [], "balances": []}
+            for user_id in user_ids:
+                self.__user_rows(user_id, rows)
+
+            db.session.bulk_insert_mappings(TwoFactorAuth, rows["twofa"])
+            db.session.bulk_insert_mappings(Holdings, rows["holdings"])
+            db.session.bulk_insert_mappings(Transacted, rows["transacted"])
+            db.session.bulk_insert_mappings(ClosedPositions, rows["closed"])
+            db.session.bulk_insert_mappings(Balances, rows["balances"])
+            db.session.commit()
+            inserted += count + sum(len(chunk) for chunk in rows.values())
+        return inserted
+
+    @classmethod
+    def user_ids(cls, limit):
+        """ The ids of (up to the limit) seeded users """
+        return [user_id for user_id, in db.session.query(Users.id).filter(
+            Users.username.like(f"{cls.PREFIX}%")).order_by(Users.id).limit(limit)]
@@ -5,6 +5,7 @@ from flask import current_app as app
 from ..internal.filters import usd
 from ..internal.redirects import Redirects
 from ..manager import AccountManager, UserContext
+from .. import limiter
 
 from .decorators import authenticated, not_logged_in
 from .forms import AccountForms as _forms
@@ -12,6 +13,7 @@ from .templates import AccountTemplates as _templates
 
 @app.route("/forgot-username", methods=["GET", "POST"])
 @not_logged_in
+@limiter.limit("reset", ("POST",), _templates.too_many_attempts)
 def forgot_username():
 	"""Forgot Username"""
 	form = _forms.forgot_username(request)
@@ -23,6 +25,7 @@ def forgot_username():
 
 @app.route("/reset-password", methods=["GET", "POST"])
 @not_logged_in
+@limiter.limit("reset", ("POST",), _templates.too_many_attempts)
 def password_reset():
 	"""Password reset"""
 	form = _forms.password_reset(request)
@@ -33,6 +36,7 @@ def password_reset():
 	return _templates.password_reset(form)
 
 @app.route("/change-password", methods=["GET", "POST"])
+@limiter.limit("reset", ("POST",), _templates.too_many_attempts)
 def change_password():
 	"""Update the user's password"""
 	_token = request.args.get("token")
@@ -48,6 +52,9 @@ def change_password():
 			if isinstance(e, AccountManager.ResetPasswordExpired):
 				flash('The reset password link has expired. Please request a new one.', "error")
 			return Redirects.login()
+		except AccountManager.Busy:
+			flash("We're experiencing a high volume of requests. Please retry shortly.", "error")
+			return _templates.change_password(form, _token), 503, {"Retry-After": "1"}
 	return _templates.change_password(form, _token)
 
 @app.route("/account", methods=["GET", "POST"])
@@ -7,6 +7,7 @@ from flask import current_app as app
 from ..internal.tokens import JWTTokens
 from ..internal.redirects import Redirects
 from ..manager import Registrar, BasicAuth, TwoFactAuth, AccountManager, UserContext
+from .. import limiter
 
 from .decorators import unverified, unauthenticated, not_logged_in
 from .forms import AuthForms as _forms
@@ -14,6 +15,7 @@ from .templates import AuthTemplates as _templates
 
 @app.route("/register", methods=["GET", "POST"])
 @not_logged_in
+@limiter.limit("register", ("POST",), _templates.too_many_attempts)
 def register():
 	""" Register a user in the system. The username, and email must be unique """
 	form = _forms.register(request)
@@ -25,10 +27,14 @@ def register():
 			return Redirects.home()
 		except Registrar.UserAlreadyRegistered:
 			flash('User alreaded registered!', "error")
+		except Registrar.Busy:
+			flash("We're experiencing a high volume of requests. Please retry shortly.", "error")
+			return _templates.register(form), 503, {"Retry-After": "1"}
 	return _templates.register(form)
 
 @app.route("/login", methods=["GET", "POST"])
 @not_logged_in
+@limiter.limit("login", ("POST",), _templates.too_many_attempts)
 def login():
 	""" Log user in. Depending on their registration / authenication configs the user 
 		will be directed to the appopriate place to either complete their verification
@@ -59,6 +65,9 @@ def login():
 				flash("Invalid username or password.", "error")
 			else:
 				flash("Account locked. Please reset your password via forgot my password.", "error")
+		except BasicAuth.Busy:
+			flash("We're experiencing a high volume of logins. Please try again.", "error")
+			return _templates.login(form), 503, {"Retry-After": "1"}
 	return _templates.login(form)
 
 @app.route("/logout")
@@ -126,6 +135,7 @@ def resend_otp():
 	
 @app.route("/verify-otp", methods=["GET", "POST"])
 @unauthenticated
+@limiter.limit("otp", ("POST",), _templates.too_many_attempts)
 def verify_otp():
 	""" Verify the OTP provided by the user matches the one sent to them """
 	method = request.args.get("method", default="")
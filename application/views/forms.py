@@ -138,11 +138,11 @@ class SellForm(FlaskForm):
 		super().__init__(form)
 
 		from ..manager import PortfolioManager
-		self.holdings = PortfolioManager.query_holdings_by_user()
+		self.holdings = PortfolioManager.query_holdings_by_user().all()
 		self.symbol.choices = [(holding.id, holding.symbol) for holding in self.holdings]
 
 		if request.method == "GET":
-			holding = self.holdings.first()
+			holding = self.holdings[0] if self.holdings else None
 			if holding:
 				symbol = request.args.get("symbol", default = "")
 				if symbol != "":
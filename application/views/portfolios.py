@@ -76,9 +76,17 @@ def buy():
 	"""Buy shares of stock"""
 	form = _forms.buy(request)
 	if request.method == "POST" and form.validate_on_submit():
-		if PortfolioManager.buy(form.symbol.data, form.shares.data):
+		if PortfolioManager.asking_price(form.symbol.data) is None:
+			flash("Invalid Symbol.", "error")
+		elif PortfolioManager.is_market_closed():
+			if PortfolioManager.queue_buy(form.symbol.data, form.shares.data):
+				flash("Market is closed! Order queued for the market open.", "success")
+				return Redirects.home()
+			flash(" ".join(["Buying", str(form.shares.data), "shares would exceed cash on hand."]), "error")
+		elif PortfolioManager.buy(form.symbol.data, form.shares.data):
 			return Redirects.home()
-		flash(" ".join(["Buying", str(form.shares.data), "shares would exceed cash on hand."]), "error")
+		else:
+			flash(" ".join(["Buying", str(form.shares.data), "shares would exceed cash on hand."]), "error")
 	
 	if PortfolioManager.is_market_closed():
 		flash("Market is closed!", "error")
@@ -90,7 +98,11 @@ def sell():
 	"""Sell shares of stock"""
 	form = _forms.sell(request)
 	if request.method == "POST" and form.validate_on_submit():
-		PortfolioManager.sell(form.selected_holding(), form.shares.data)
+		if PortfolioManager.is_market_closed():
+			PortfolioManager.queue_sell(form.selected_holding(), form.shares.data)
+			flash("Market is closed! Order queued for the market open.", "success")
+		else:
+			PortfolioManager.sell(form.selected_holding(), form.shares.data)
 		return Redirects.home()
 	
 	if PortfolioManager.is_market_closed():
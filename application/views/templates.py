@@ -2,6 +2,7 @@
 from flask import render_template, request
 
 from ..internal.urls import URLs
+from ..internal.tracing import span
 from ..internal.utils import escape
 
 from .forms import LoginForm
@@ -10,7 +11,8 @@ class BaseTemplates:
     @classmethod
     def template(cls, name, **kwargs):
         dir = cls.__dict__["__dir__"] if "__dir__" in cls.__dict__ else "" 
-        return render_template("".join([dir, name]), desktop=not getattr(request, "MOBILE", False), **kwargs)
+        with span("render", template=name):
+            return render_template("".join([dir, name]), desktop=not getattr(request, "MOBILE", False), **kwargs)
 
     @classmethod
     def form(cls, _template, form, **kwargs):
@@ -20,6 +22,10 @@ class BaseTemplates:
     def apology(message: str, code: int = 400):
         return render_template("apology.html", top=code, bottom=escape(message)), code
 
+    @classmethod
+    def too_many_attempts(cls):
+        return cls.apology("Too many attempts, please try again shortly.", 429)
+
 class AuthTemplates(BaseTemplates):
     __dir__ = "/auth/"
 
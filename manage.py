@@ -1,14 +1,23 @@
 """Flask shell script"""
 import sys
 import os
+import time
 
 from dotenv import load_dotenv
+from flask import current_app
 from flask_script import Manager
 from flask_migrate import MigrateCommand
 
 from application.internal.dates import Dates
-from application.manager import Registrar, AccountManager
-from application import create_app
+from application.manager import Registrar, AccountManager, PortfolioManager, OrderQueue, Outbox
+from application.seeds import Seeder
+from application.benchmarks import Benchmarks
+from application.loadtest import LoadGenerator
+from application.internal.iexstub import IEXStub
+from application.internal.marketsim import MarketSimulator
+from application.internal.georanges import GeoRanges
+from application.internal.compression import Compression
+from application import create_app, db
 
 load_dotenv(os.path.join(sys.path[0], '.env'))
 manager = Manager(create_app())
@@ -18,7 +27,7 @@ manager.add_command('db', MigrateCommand)
 def create_admin(password, reset="false"):
     """Creates the admin account"""        
     try:
-        admin = Registrar.query_by_username("finadmin")
+        admin = Registrar.query_by_username(Registrar.ADMIN)
         if admin is None:
             print("Creating admin account....")
         else:
@@ -29,7 +38,7 @@ def create_admin(password, reset="false"):
             print("Reseting admin account....")
             Registrar.unregister(admin.id)
 
-        Registrar.register("finadmin", "Admin", "Admin", "admin@fin4dummy.com", 
+        Registrar.register(Registrar.ADMIN, "Admin", "Admin", "admin@fin4dummy.com", 
             password, True, False, False)
         print("Complete.")
     except Exception as e:
@@ -51,5 +60,184 @@ def update_accounts(force="false"):
         print(" ".join(["Error occurred while updating accounts: \n", str(e)]))
         db.session.rollback()
 
+@manager.command
+def settle_orders(force="false"):
+    """Settles the orders queued while the market was closed"""
+    if force.lower() != "true" and PortfolioManager.is_market_closed():
+        print("Orders are only settled while the market is open.")
+        return
+
+    try:
+        print("Settling orders....")
+        report = OrderQueue.settle()
+        settled = report["filled"] + report["rejected"]
+        rate = settled / report["seconds"] if report["seconds"] > 0 else 0.0
+        print(f"Filled {report['filled']}, rejected {report['rejected']} in {report['seconds']:.2f}s ({rate:,.1f} orders/s).")
+        if report["deferred"]:
+            print(f"{report['deferred']} orders couldn't be priced and remain queued, re-run to settle them.")
+        print("Complete.")
+    except Exception as e:
+        print(" ".join(["Error occurred while settling orders: \n", str(e)]))
+        db.session.rollback()
+
+@manager.command
+def drain_outbox(batch="100", interval="1", once="false"):
+    """Delivers the mails / sms in the outbox, reporting the queue depth and drain rate. Sent / dead
+    notifications past the retention period are purged hourly"""
+    print("Draining outbox....")
+    totals = {"sent": 0, "retried": 0, "dead": 0}
+    reported = time.perf_counter()
+    purged = None
+    drained = 0
+    while True:
+        if purged is None or time.perf_counter() - purged >= 3600:
+            try:
+                count = Outbox.purge()
+                if count:
+                    print(f"Purged {count:,} sent / dead notifications.")
+            except Exception as e:
+                print(" ".join(["Error occurred while purging outbox: \n", str(e)]))
+                db.session.rollback()
+            purged = time.perf_counter()
+
+        try:
+            report = Outbox.drain(int(batch))
+        except Exception as e:
+            print(" ".join(["Error occurred while draining outbox: \n", str(e)]))
+            db.session.rollback()
+            report = {"sent": 0, "retried": 0, "dead": 0}
+
+        for key, count in report.items():
+            totals[key] += count
+        drained += report["sent"] + report["dead"]
+
+        elapsed = time.perf_counter() - reported
+        if once.lower() == "true" or elapsed >= 10:
+            depth = Outbox.depth()
+            print(f"Pending {depth.get('PENDING', 0):,} dead {depth.get('DEAD', 0):,}, drained {drained / elapsed:,.1f}/s "
+                f"(sent {totals['sent']:,}, retried {totals['retried']:,}, dead lettered {totals['dead']:,}).")
+            reported = time.perf_counter()
+            drained = 0
+        if once.lower() == "true":
+            break
+        if sum(report.values()) < int(batch):
+            time.sleep(float(interval))
+    print("Complete.")
+
+@manager.command
+def seed(users="100", seed="1"):
+    """Bulk seeds synthetic users with holdings, transactions, closed positions and balances"""
+    try:
+        print("Seeding users....")
+        start = time.perf_counter()
+        rows = Seeder(int(seed)).seed(int(users))
+        print(f"Inserted {rows:,} rows in {time.perf_counter() - start:.2f}s.")
+        print("Complete.")
+    except Exception as e:
+        print(" ".join(["Error occurred while seeding users: \n", str(e)]))
+        db.session.rollback()
+
+@manager.command
+def benchmark(users="25", repeat="5", cold="false", names="", output="benchmark.json"):
+    """Benchmarks the manager layer against the seeded users with IEX served by a local stub"""
+    try:
+        benchmarks = Benchmarks(int(users), int(repeat), cold.lower() == "true")
+    except Benchmarks.NoUsers as e:
+        print(str(e))
+        return
+    results = benchmarks.run([name for name in names.split(",") if name])
+    Benchmarks.write(results, output)
+
+    for name, result in results["results"].items():
+        queries = "" if result["queries"] is None else f" {result['queries']:.1f} queries"
+        print(f"{name:<20} median {result['median_ms']:8.2f}ms p95 {result['p95_ms']:8.2f}ms{queries}")
+    print(f"Results written to {output}.")
+
+@manager.command
+def benchmark_compression(users="10", repeat="20", output="benchmark-compression.json"):
+    """Compares the cpu cost of the gzip / brotli settings against the bytes saved on the seeded users' JSON responses"""
+    try:
+        benchmarks = Benchmarks(int(users), int(repeat))
+    except Benchmarks.NoUsers as e:
+        print(str(e))
+        return
+    results = benchmarks.compression()
+    Benchmarks.write(results, output)
+
+    for name, result in results["results"].items():
+        print(f"{name:<20} {result['bytes'] / 1024:8.1f}KB")
+        for codec, stats in result["codecs"].items():
+            print(f"  {codec:<10} {stats['bytes'] / 1024:8.1f}KB saved {stats['saved_pct']:5.1f}% {stats['cpu_ms']:8.3f}ms cpu")
+    print(f"Results written to {output}.")
+
+@manager.command
+def benchmark_serialization(users="100", repeat="20", output="benchmark-serialization.json"):
+    """Compares the rows per second of the JSON API serializers against asdict + jsonify on the seeded users' rows"""
+    try:
+        benchmarks = Benchmarks(int(users), int(repeat))
+    except Benchmarks.NoUsers as e:
+        print(str(e))
+        return
+    results = benchmarks.serialization()
+    Benchmarks.write(results, output)
+
+    for name, result in results["results"].items():
+        print(f"{name:<20} {result['rows']:8} rows ({result['backend']})")
+        for serializer, stats in result["serializers"].items():
+            print(f"  {serializer:<16} {stats['median_ms']:8.2f}ms {stats['rows_per_sec'] or 0:12.0f} rows/sec")
+    print(f"Results written to {output}.")
+
+@manager.command
+def compress_static(level="9", quality="11"):
+    """Writes the precompressed (.gz / .br) siblings of the static assets served by the app"""
+    count = Compression.compress_static(current_app.static_folder, gzip_level=int(level), brotli_quality=int(quality))
+    print(f"{count} assets compressed.")
+
+@manager.command
+def loadtest(target="http://127.0.0.1:8080", users="10", duration="60", flow="web", output="loadtest.json"):
+    """Drives seeded virtual users through the web (or api) flow against a running server"""
+    generator = LoadGenerator(target, int(users), int(duration), flow)
+    print(f"Running the {flow} flow with {users} users for {duration}s against {target}....")
+    results = generator.run()
+    LoadGenerator.write(results, output)
+
+    for step, result in results["steps"].items():
+        print(f"{step:<16} {result['requests']:>7} reqs {result['errors']:>5} errors {result['rps']:8.1f}/s "
+            f"p50 {result['p50_ms']:8.2f}ms p95 {result['p95_ms']:8.2f}ms p99 {result['p99_ms']:8.2f}ms")
+    print(f"Total {results['requests']:,} requests ({results['rps']:,.1f}/s), {results['errors']:,} errors.")
+    print(f"Results written to {output}.")
+
+@manager.command
+def geo_database(source, output=""):
+    """Compiles the csv of ip ranges into the offline geolocation database, running apps reload it"""
+    output = output or current_app.config["GEO_DATABASE"]
+    if not output:
+        print("Specify the output or set GEO_DATABASE.")
+        return
+
+    try:
+        print("Compiling geolocation database....")
+        start = time.perf_counter()
+        ranges = GeoRanges.compile(source, output)
+        print(f"Compiled {ranges:,} ranges into {output} in {time.perf_counter() - start:.2f}s.")
+        print("Complete.")
+    except Exception as e:
+        print(" ".join(["Error occurred while compiling geolocation database: \n", str(e)]))
+
+@manager.command
+def simulate_market(host="127.0.0.1", port="8900", count="500", tick="1000", seed="1"):
+    """Serves simulated IEX market data, point IEX_BASE_URL at the url printed"""
+    market = MarketSimulator(int(count), int(tick), int(seed)).start()
+    stub = IEXStub(host, int(port), market)
+    print(f"Simulating {count} symbols ticking every {tick}ms at {stub.url}....")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        market.stop()
+        stub.server.server_close()
+    print("Complete.")
+
 if __name__ == "__main__":
     manager.run()